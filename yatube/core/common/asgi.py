@@ -0,0 +1,198 @@
+"""ASGI-обёртка над WSGI-приложением Django.
+
+Своего ASGI-обработчика у Django 2.2 нет. Здесь соединения держит цикл
+событий: тело запроса дочитывается и ответ отсылается асинхронно, а
+потоку из пула остаётся только работа самого Django. Медленный клиент
+больше не занимает поток, и на процесс приходится сколько угодно
+открытых соединений при ASGI_THREADS потоках.
+
+Ответ с корутиной asgi_stream (например, поток событий) после заголовков
+продолжается в цикле событий и поток не держит вовсе.
+
+Раздельные потоки безопасны для кешей проекта: у SQLiteCache своё
+соединение в каждом потоке, LocalCache защищён блокировкой.
+"""
+import asyncio
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+# Тело запроса больше этого уходит из памяти во временный файл.
+SPOOL_BYTES = 1024 * 1024
+
+
+def environ_from_scope(scope, body):
+    """WSGI environ для HTTP-запроса ASGI с телом в файле body."""
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode().decode('latin1'),
+        'PATH_INFO': path.encode().decode('latin1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    host, port = scope.get('server') or ('localhost', 80)
+    environ['SERVER_NAME'], environ['SERVER_PORT'] = host, str(port)
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+        environ['REMOTE_PORT'] = str(scope['client'][1])
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        value = value.decode('latin1')
+        if name in environ:
+            separator = '; ' if name == 'HTTP_COOKIE' else ','
+            value = environ[name] + separator + value
+        environ[name] = value
+    return environ
+
+
+class ASGIHandler:
+    """ASGI-приложение, выполняющее WSGI-приложение в пуле потоков."""
+
+    def __init__(self, application, threads=None):
+        self.application = application
+        self.executor = ThreadPoolExecutor(
+            threads or settings.ASGI_THREADS, thread_name_prefix='asgi'
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        else:
+            raise ValueError(f'Соединения {scope["type"]} не поддерживаются')
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, receive):
+        """Тело запроса или None, если клиент ушёл, не дослав его."""
+        body = tempfile.SpooledTemporaryFile(SPOOL_BYTES)
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return None
+            body.write(message.get('body', b''))
+            if not message.get('more_body', False):
+                body.seek(0)
+                return body
+
+    def run(self, environ):
+        """Вызвать приложение; ответ, лежащий в памяти, собрать сразу."""
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [
+                (name.lower().encode('latin1'), value.encode('latin1'))
+                for name, value in headers
+            ]
+
+        result = self.application(environ, start_response)
+        if getattr(result, 'streaming', True):
+            return started, None, result
+        try:
+            content = b''.join(result)
+        finally:
+            result.close()
+        return started, content, None
+
+    async def http(self, scope, receive, send):
+        body = await self.read_body(receive)
+        if body is None:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            started, content, result = await loop.run_in_executor(
+                self.executor, self.run, environ_from_scope(scope, body)
+            )
+        finally:
+            body.close()
+        await send({
+            'type': 'http.response.start',
+            'status': started['status'],
+            'headers': started['headers'],
+        })
+        if result is None:
+            await send({'type': 'http.response.body', 'body': content})
+            return
+        stream = getattr(result, 'asgi_stream', None)
+        if stream is not None:
+            await loop.run_in_executor(self.executor, result.close)
+            await self.stream(stream, receive, send)
+            return
+        # Потоковый ответ (файлы) читается по куску в пуле потоков.
+        try:
+            chunks = iter(result)
+            while True:
+                chunk = await loop.run_in_executor(
+                    self.executor, next, chunks, None
+                )
+                if chunk is None:
+                    break
+                await send({
+                    'type': 'http.response.body',
+                    'body': chunk, 'more_body': True,
+                })
+            await send({'type': 'http.response.body'})
+        finally:
+            if hasattr(result, 'close'):
+                await loop.run_in_executor(self.executor, result.close)
+
+    async def stream(self, stream, receive, send):
+        """Долгий ответ, который сам пишет себя в цикле событий.
+
+        stream(send_body, run_sync) — корутина ответа: send_body(bytes)
+        отправляет кусок, run_sync(func, *args) выполняет блокирующий
+        вызов в пуле. Корутина отменяется, когда клиент отключается.
+        """
+        loop = asyncio.get_running_loop()
+
+        async def send_body(chunk):
+            await send({
+                'type': 'http.response.body', 'body': chunk,
+                'more_body': True,
+            })
+
+        def run_sync(func, *args):
+            return loop.run_in_executor(self.executor, func, *args)
+
+        async def disconnected():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        writer = asyncio.ensure_future(stream(send_body, run_sync))
+        watcher = asyncio.ensure_future(disconnected())
+        try:
+            await asyncio.wait(
+                {writer, watcher}, return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            writer.cancel()
+            watcher.cancel()
+        if writer.done() and not writer.cancelled():
+            writer.result()
+            await send({'type': 'http.response.body'})
@@ -0,0 +1,322 @@
+"""Кеш в файле SQLite, общий для всех процессов на одной машине.
+
+LocMemCache у каждого WSGI-воркера свой: записи дублируются по числу
+воркеров, а запись, положенная одним, не видна другим. Здесь данные
+лежат в одном файле в режиме WAL, поэтому чтения не блокируют запись.
+Объём ограничен в байтах, при переполнении удаляются давно не
+читанные записи. Увеличение счётчика выполняется в одной транзакции и
+атомарно для всех процессов.
+
+Подключение::
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.common.cache.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube-cache.sqlite3',
+            'OPTIONS': {'MAX_BYTES': 64 * 1024 * 1024},
+        }
+    }
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed_idx ON cache (accessed);
+CREATE TABLE IF NOT EXISTS cache_size (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    total INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_size (id, total) VALUES (1, 0);
+CREATE TRIGGER IF NOT EXISTS cache_size_insert AFTER INSERT ON cache
+BEGIN
+    UPDATE cache_size SET total = total + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_size_delete AFTER DELETE ON cache
+BEGIN
+    UPDATE cache_size SET total = total - OLD.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_size_update AFTER UPDATE OF size ON cache
+BEGIN
+    UPDATE cache_size SET total = total - OLD.size + NEW.size;
+END;
+'''
+
+
+class SQLiteCache(BaseCache):
+    """Общий кеш с вытеснением давно не читанных записей по объёму.
+
+    OPTIONS:
+        MAX_BYTES — предел суммарного размера значений;
+        CULL_RATIO — до какой доли предела чистить при переполнении;
+        ACCESS_RESOLUTION — время последнего чтения обновляется не чаще
+            раза в столько секунд, чтобы чтения почти не писали в файл.
+    """
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.location = location
+        self.max_bytes = int(options.get('MAX_BYTES', 64 * 1024 * 1024))
+        self.cull_ratio = float(options.get('CULL_RATIO', 0.9))
+        self.access_resolution = float(options.get('ACCESS_RESOLUTION', 1))
+        self._local = threading.local()
+
+    @property
+    def _db(self):
+        # Соединение своё у каждого потока и не переживает fork.
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.location)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(
+                self.location, timeout=30, isolation_level=None,
+                check_same_thread=False,
+            )
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.executescript(SCHEMA)
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    @contextmanager
+    def _write(self):
+        """Транзакция, сразу берущая блокировку на запись."""
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def _encode(self, value):
+        return pickle.dumps(value, self.pickle_protocol)
+
+    def _expiry(self, timeout):
+        return self.get_backend_timeout(timeout)
+
+    def _fetch(self, keys, now):
+        placeholders = ', '.join('?' * len(keys))
+        rows = self._db.execute(
+            f'SELECT key, value, expires, accessed FROM cache '
+            f'WHERE key IN ({placeholders})', keys,
+        ).fetchall()
+        found, stale, touched = {}, [], []
+        for key, value, expires, accessed in rows:
+            if expires is not None and expires <= now:
+                stale.append(key)
+                continue
+            found[key] = pickle.loads(value)
+            if now - accessed >= self.access_resolution:
+                touched.append(key)
+        if stale or touched:
+            with self._write() as db:
+                db.executemany(
+                    'DELETE FROM cache WHERE key = ? '
+                    'AND expires IS NOT NULL AND expires <= ?',
+                    [(key, now) for key in stale],
+                )
+                db.executemany(
+                    'UPDATE cache SET accessed = ? WHERE key = ?',
+                    [(now, key) for key in touched],
+                )
+        return found
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._fetch([key], time.time()).get(key, default)
+
+    def get_many(self, keys, version=None):
+        made = {self.make_key(key, version=version): key for key in keys}
+        for key in made:
+            self.validate_key(key)
+        if not made:
+            return {}
+        found = self._fetch(list(made), time.time())
+        return {made[key]: value for key, value in found.items()}
+
+    def _store(self, db, key, value, timeout, now):
+        data = self._encode(value)
+        db.execute(
+            'INSERT OR REPLACE INTO cache '
+            '(key, value, expires, accessed, size) VALUES (?, ?, ?, ?, ?)',
+            (key, data, self._expiry(timeout), now, len(data)),
+        )
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        with self._write() as db:
+            self._store(db, key, value, timeout, now)
+            self._cull(db, now)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        with self._write() as db:
+            for key, value in data.items():
+                key = self.make_key(key, version=version)
+                self.validate_key(key)
+                self._store(db, key, value, timeout, now)
+            self._cull(db, now)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        with self._write() as db:
+            db.execute(
+                'DELETE FROM cache WHERE key = ? '
+                'AND expires IS NOT NULL AND expires <= ?', (key, now),
+            )
+            data = self._encode(value)
+            added = db.execute(
+                'INSERT OR IGNORE INTO cache '
+                '(key, value, expires, accessed, size) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, data, self._expiry(timeout), now, len(data)),
+            ).rowcount == 1
+            if added:
+                self._cull(db, now)
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        with self._write() as db:
+            row = db.execute(
+                'SELECT value, expires FROM cache WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None or row[1] is not None and row[1] <= now:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            data = self._encode(value)
+            db.execute(
+                'UPDATE cache SET value = ?, size = ?, accessed = ? '
+                'WHERE key = ?', (data, len(data), now, key),
+            )
+        return value
+
+    def incr_many(self, deltas, timeout=None, version=None):
+        """Увеличить счётчики одной транзакцией.
+
+        В отличие от incr, отсутствующий счётчик не ошибка: он начинается
+        с нуля и живёт timeout секунд (по умолчанию — бессрочно).
+        """
+        made = {self.make_key(key, version=version): key for key in deltas}
+        for key in made:
+            self.validate_key(key)
+        if not made:
+            return {}
+        now = time.time()
+        placeholders = ', '.join('?' * len(made))
+        values = {}
+        with self._write() as db:
+            found = dict(db.execute(
+                f'SELECT key, value FROM cache WHERE key IN ({placeholders}) '
+                f'AND (expires IS NULL OR expires > ?)', [*made, now],
+            ).fetchall())
+            for key, name in made.items():
+                if key not in found:
+                    values[name] = deltas[name]
+                    self._store(db, key, deltas[name], timeout, now)
+                    continue
+                values[name] = pickle.loads(found[key]) + deltas[name]
+                data = self._encode(values[name])
+                db.execute(
+                    'UPDATE cache SET value = ?, size = ?, accessed = ? '
+                    'WHERE key = ?', (data, len(data), now, key),
+                )
+            if len(found) < len(made):
+                self._cull(db, now)
+        return values
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        with self._write() as db:
+            return db.execute(
+                'UPDATE cache SET expires = ? WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (self._expiry(timeout), key, now),
+            ).rowcount == 1
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._db.execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)', (key, time.time()),
+        ).fetchone() is not None
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._write() as db:
+            db.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        for key in keys:
+            self.validate_key(key)
+        with self._write() as db:
+            db.executemany(
+                'DELETE FROM cache WHERE key = ?', [(key,) for key in keys]
+            )
+
+    def clear(self):
+        with self._write() as db:
+            db.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Соединение живёт весь процесс: открывать файл на каждый запрос
+        # дороже, чем держать его.
+        pass
+
+    def size(self):
+        """Суммарный размер значений в байтах."""
+        return self._db.execute(
+            'SELECT total FROM cache_size'
+        ).fetchone()[0]
+
+    def _cull(self, db, now):
+        total = db.execute('SELECT total FROM cache_size').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        db.execute(
+            'DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?',
+            (now,),
+        )
+        target = self.max_bytes * self.cull_ratio
+        # Накопленный размер от самых свежих записей к старым: всё, что
+        # не помещается в целевой объём, удаляется одним запросом.
+        db.execute(
+            'DELETE FROM cache WHERE key IN ('
+            '  SELECT key FROM ('
+            '    SELECT key, SUM(size) OVER ('
+            '      ORDER BY accessed DESC, key'
+            '    ) AS running FROM cache'
+            '  ) WHERE running > ?'
+            ')', (target,),
+        )
@@ -0,0 +1,44 @@
+"""Счётчики статистики в общем кеше.
+
+Счётчик увеличивается одной записью: у SQLiteCache — incr_many в одной
+транзакции, сколько бы счётчиков ни менялось сразу. С другими кешами
+отсутствующий счётчик создаётся через add, а затем увеличивается incr.
+"""
+from django.core.cache import cache
+
+
+def incr_many(deltas):
+    """Увеличить счётчики (ключ: шаг); отсутствующие начинаются с нуля."""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    if hasattr(cache, 'incr_many'):
+        cache.incr_many(deltas)
+        return
+    for key, delta in deltas.items():
+        if not cache.add(key, delta, None):
+            cache.incr(key, delta)
+
+
+class Counters:
+    """Именованные счётчики с общим префиксом ключей."""
+
+    def __init__(self, prefix, names):
+        self.prefix = prefix
+        self.names = tuple(names)
+
+    def key(self, name):
+        return f'{self.prefix}:{name}'
+
+    def keys(self):
+        return [self.key(name) for name in self.names]
+
+    def count(self, **deltas):
+        incr_many({self.key(name): delta for name, delta in deltas.items()})
+
+    def values(self):
+        found = cache.get_many(self.keys())
+        return {name: found.get(self.key(name), 0) for name in self.names}
+
+    def reset(self):
+        cache.delete_many(self.keys())
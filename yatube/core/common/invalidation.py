@@ -0,0 +1,129 @@
+"""Сброс кешей внутри процессов всех воркеров на машине.
+
+Поколения лежат в небольшом файле, отображённом в память каждого
+процесса: массив счётчиков, а пространство имён (или ключ в нём)
+попадает в ячейку по хешу. Сигнал модели увеличивает счётчик, и все
+воркеры видят это при следующем чтении, без TTL и без сообщений.
+Совпадение ячеек двух имён даёт лишний сброс, но не устаревшее значение.
+"""
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+
+SLOTS = 4096
+SLOT = struct.Struct('=Q')
+MISSING = object()
+
+_lock = threading.Lock()
+_state = {}
+
+
+def _map():
+    # Отображение своё у каждого процесса и заново открывается после fork.
+    pid = os.getpid()
+    if _state.get('pid') != pid:
+        with _lock:
+            if _state.get('pid') != pid:
+                path = settings.INVALIDATION_BUS_PATH
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+                if os.fstat(fd).st_size < SLOTS * SLOT.size:
+                    os.ftruncate(fd, SLOTS * SLOT.size)
+                _state['fd'] = fd
+                _state['map'] = mmap.mmap(fd, SLOTS * SLOT.size)
+                _state['pid'] = pid
+    return _state['map']
+
+
+def _slot(namespace, key=None):
+    name = namespace if key is None else f'{namespace}:{key}'
+    return zlib.crc32(name.encode()) % SLOTS * SLOT.size
+
+
+def generation(namespace, key=None):
+    return SLOT.unpack_from(_map(), _slot(namespace, key))[0]
+
+
+def _increment(offsets):
+    buffer = _map()
+    fcntl.flock(_state['fd'], fcntl.LOCK_EX)
+    try:
+        for offset in offsets:
+            value = SLOT.unpack_from(buffer, offset)[0]
+            SLOT.pack_into(buffer, offset, value + 1)
+    finally:
+        fcntl.flock(_state['fd'], fcntl.LOCK_UN)
+
+
+def bump(namespace, *keys):
+    """Сбросить всё пространство имён или только перечисленные ключи.
+
+    Сброс повторяется после коммита: иначе другой воркер мог бы между
+    сигналом и коммитом прочитать старую строку и запомнить её уже с
+    новым поколением.
+    """
+    offsets = (
+        {_slot(namespace, key) for key in keys} if keys
+        else {_slot(namespace)}
+    )
+    _increment(offsets)
+    transaction.on_commit(lambda: _increment(offsets))
+
+
+class LocalCache:
+    """Кеш в памяти процесса, сбрасываемый через bump() из любого воркера.
+
+    Значение помнит поколения пространства имён и своего ключа и при
+    чтении сверяет их с текущими.
+    """
+
+    def __init__(self, namespace, max_entries=1024):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _stamp(self, key):
+        return (
+            generation(self.namespace), generation(self.namespace, key)
+        )
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            if entry[0] != self._stamp(key):
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def get_or_set(self, key, load):
+        """Значение из кеша или результат load(), который запоминается.
+
+        Поколения снимаются до загрузки, чтобы сброс во время неё
+        не потерялся.
+        """
+        value = self.get(key, MISSING)
+        if value is not MISSING:
+            return value
+        stamp = self._stamp(key)
+        value = load()
+        with self._lock:
+            self._data[key] = (stamp, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,215 @@
+import base64
+import heapq
+import json
+from datetime import datetime
+
+from django.core.cache import cache
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+
+class CursorPaginator(Paginator):
+    """Постраничная навигация по ключу (pub_date, id).
+
+    Вместо COUNT(*) и LIMIT/OFFSET страница ищется по значению ключа
+    последней (или первой) записи предыдущей страницы. Курсоры непрозрачны
+    для клиента и не «съезжают», когда во время прокрутки появляются
+    новые записи.
+    """
+    is_keyset = True
+
+    def __init__(self, object_list, per_page, keys=('pub_date', 'pk')):
+        super().__init__(object_list, per_page)
+        self.keys = keys
+        self.next_cursor = None
+        self.previous_cursor = None
+        self._number = 1
+        self._has_next = False
+
+    @property
+    def num_pages(self):
+        """Число страниц известно только до следующей включительно."""
+        return self._number + 1 if self._has_next else self._number
+
+    def get_cursor_page(self, cursor=None, number=None):
+        """Вернуть страницу по курсору.
+
+        Без курсора отдаётся первая страница. Номер страницы из старых
+        ссылок вида ``?page=N`` поддерживается без подсчёта общего числа
+        записей, дальше навигация идёт по курсорам.
+        """
+        state = self.decode_cursor(cursor)
+        if state is not None:
+            return self._seek_page(*state)
+        try:
+            number = max(int(number), 1)
+        except (TypeError, ValueError):
+            number = 1
+        rows = self._fetch(offset=(number - 1) * self.per_page)
+        if not rows and number > 1:
+            return self.get_cursor_page()
+        has_older = len(rows) > self.per_page
+        return self._build_page(
+            rows[:self.per_page], number, number > 1, has_older
+        )
+
+    def _fetch(self, values=None, reverse=False, offset=0):
+        """Записи после ключа values (или с начала ленты).
+
+        Возвращается на одну запись больше страницы: по ней видно,
+        есть ли следующая.
+        """
+        return self._fetch_from(
+            self.object_list, self.keys, values, reverse,
+            offset, offset + self.per_page + 1
+        )
+
+    def _fetch_from(self, queryset, keys, values, reverse, start, stop):
+        prefix = '' if reverse else '-'
+        queryset = queryset.order_by(*(prefix + key for key in keys))
+        if values is not None:
+            first, second = keys
+            op = 'gt' if reverse else 'lt'
+            queryset = queryset.filter(
+                Q(**{f'{first}__{op}': values[0]})
+                | Q(**{first: values[0], f'{second}__{op}': values[1]})
+            )
+        return list(queryset[start:stop])
+
+    def _seek_page(self, values, number, reverse):
+        rows = self._fetch(values, reverse)
+        if not rows:
+            return self.get_cursor_page()
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not reverse:
+            return self._build_page(rows, number, True, has_more)
+        rows.reverse()
+        # Пока листали назад, сверху могли появиться новые записи:
+        # номер страницы тогда условный, но не меньше второй.
+        number = max(number, 2) if has_more else 1
+        return self._build_page(rows, number, has_more, True)
+
+    def _build_page(self, rows, number, has_newer, has_older):
+        self._number = number
+        self._has_next = has_older and bool(rows)
+        if self._has_next:
+            self.next_cursor = self.encode_cursor(rows[-1], number + 1)
+        if has_newer and rows:
+            self.previous_cursor = self.encode_cursor(
+                rows[0], number - 1, reverse=True
+            )
+        return Page(rows, number, self)
+
+    def _key_values(self, obj):
+        return [getattr(obj, key) for key in self.keys]
+
+    def encode_cursor(self, obj, number, reverse=False):
+        values = [
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in self._key_values(obj)
+        ]
+        payload = json.dumps([values, number, int(reverse)])
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            values, number, reverse = json.loads(
+                base64.urlsafe_b64decode(cursor.encode())
+            )
+            values = [parse_datetime(values[0]), int(values[1])]
+            number = max(int(number), 1)
+        except (TypeError, ValueError, IndexError):
+            return None
+        if values[0] is None:
+            return None
+        return values, number, bool(reverse)
+
+
+class MergedCursorPaginator(CursorPaginator):
+    """Лента, слитая из нескольких источников.
+
+    Источник — тройка (queryset, ключи, преобразование строки в запись
+    ленты). Из каждого источника берётся не больше страницы записей после
+    курсора, затем они сливаются кучей по (pub_date, pk) и очищаются от
+    повторов.
+    """
+
+    def _fetch(self, values=None, reverse=False, offset=0):
+        stop = offset + self.per_page + 1
+        streams = []
+        for queryset, keys, convert in self.object_list:
+            rows = self._fetch_from(queryset, keys, values, reverse, 0, stop)
+            streams.append(map(convert, rows) if convert else rows)
+        merged = heapq.merge(
+            *streams, key=self._key_values, reverse=not reverse
+        )
+        rows, seen = [], set()
+        for obj in merged:
+            if obj.pk in seen:
+                continue
+            seen.add(obj.pk)
+            rows.append(obj)
+            if len(rows) == stop:
+                break
+        return rows[offset:]
+
+
+class CachedCountPaginator(Paginator):
+    """Нумерованные страницы с сокращённым списком ссылок.
+
+    Общее число записей берётся из кеша по ключу ленты, поэтому COUNT(*)
+    выполняется только после того, как ключ сбросили при добавлении или
+    удалении записи. В шаблон отдаётся окно страниц вокруг текущей.
+    """
+    is_keyset = False
+    ELLIPSIS = '…'
+
+    def __init__(self, object_list, per_page, count_key=None,
+                 timeout=None):
+        super().__init__(object_list, per_page)
+        self.count_key = count_key
+        self.timeout = timeout
+        self.elided_page_range = []
+
+    @cached_property
+    def count(self):
+        if self.count_key is None:
+            return super().count
+        count = cache.get(self.count_key)
+        if count is None:
+            count = super().count
+            cache.set(self.count_key, count, self.timeout)
+        return count
+
+    def get_page(self, number):
+        page = super().get_page(number)
+        self.elided_page_range = list(
+            self.get_elided_page_range(page.number)
+        )
+        return page
+
+    def get_elided_page_range(self, number=1, on_each_side=2, on_ends=1):
+        """Номера страниц вокруг текущей и по краям, пропуски — многоточие."""
+        number = self.validate_number(number)
+        if self.num_pages <= (on_each_side + on_ends) * 2:
+            yield from self.page_range
+            return
+        if number > 1 + on_each_side + on_ends + 1:
+            yield from range(1, on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        if number < self.num_pages - on_each_side - on_ends - 1:
+            yield from range(number + 1, number + on_each_side + 1)
+            yield self.ELLIPSIS
+            yield from range(
+                self.num_pages - on_ends + 1, self.num_pages + 1
+            )
+        else:
+            yield from range(number + 1, self.num_pages + 1)
@@ -0,0 +1,159 @@
+"""Профилирование SQL по запросам.
+
+SQLProfilingMiddleware для доли SQL_PROFILE_SAMPLE_RATE запросов
+оборачивает выполнение запросов к базе (connection.execute_wrapper) и
+считает их число, время и повторы одного и того же запроса с разными
+параметрами. Запрос, повторённый не меньше SQL_PROFILE_REPEAT_THRESHOLD
+раз, — признак N+1: обращения к связанным объектам в цикле шаблона.
+
+Итоги по имени view копятся в общем кеше и видны всем воркерам на
+staff-странице sql_profile, а замеренный ответ получает заголовок
+Server-Timing. Остальные запросы не платят ничего, кроме random().
+"""
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .counters import Counters
+
+COUNTERS = ('requests', 'queries', 'db_us', 'nplusone')
+VIEWS_KEY = 'sql_profile:views'
+# Списки IN (%s, %s, …) разной длины — один и тот же запрос.
+PLACEHOLDERS = re.compile(r'\((?:\s*%s\s*,)*\s*%s\s*\)')
+# Сколько самых частых повторов помнить для каждого view.
+REPEATED_KEPT = 5
+
+
+def fingerprint(sql):
+    return PLACEHOLDERS.sub('(...)', sql)
+
+
+class QueryRecorder:
+    """execute_wrapper, считающий запросы, их время и отпечатки."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def repeated(self):
+        """Запросы, повторённые с разными параметрами: вероятные N+1."""
+        threshold = settings.SQL_PROFILE_REPEAT_THRESHOLD
+        return {
+            sql: times for sql, times in self.fingerprints.items()
+            if times >= threshold
+        }
+
+
+def counters(view):
+    return Counters(f'sql_profile:{view}', COUNTERS)
+
+
+def repeated_key(view):
+    return f'sql_profile:{view}:repeated'
+
+
+def record(view, recorder):
+    repeated = recorder.repeated()
+    counters(view).count(
+        requests=1,
+        queries=recorder.count,
+        db_us=int(recorder.duration * 1e6),
+        nplusone=1 if repeated else 0,
+    )
+    views = cache.get(VIEWS_KEY, set())
+    if view not in views:
+        cache.set(VIEWS_KEY, views | {view}, None)
+    if repeated:
+        # Худший замеченный повтор каждого запроса; гонка воркеров может
+        # потерять одно обновление, счётчики выше от неё не зависят.
+        known = cache.get(repeated_key(view), {})
+        for sql, times in repeated.items():
+            known[sql] = max(known.get(sql, 0), times)
+        top = dict(Counter(known).most_common(REPEATED_KEPT))
+        cache.set(repeated_key(view), top, None)
+
+
+def profile_stats():
+    """Итоги по view: число замеров, средние число запросов и время
+    в базе, доля замеров с N+1 и самые частые повторы."""
+    views = sorted(cache.get(VIEWS_KEY, set()))
+    found = cache.get_many(
+        [key for view in views for key in counters(view).keys()]
+        + [repeated_key(view) for view in views]
+    )
+    stats = {}
+    for view in views:
+        values = {
+            counter: found.get(counters(view).key(counter), 0)
+            for counter in COUNTERS
+        }
+        requests = values['requests'] or 1
+        stats[view] = {
+            'requests': values['requests'],
+            'queries': round(values['queries'] / requests, 1),
+            'db_ms': round(values['db_us'] / requests / 1000, 2),
+            'nplusone': round(values['nplusone'] / requests, 3),
+            'repeated': found.get(repeated_key(view), {}),
+        }
+    return stats
+
+
+def reset_stats():
+    views = cache.get(VIEWS_KEY, set())
+    cache.delete_many(
+        [key for view in views for key in counters(view).keys()]
+        + [repeated_key(view) for view in views] + [VIEWS_KEY]
+    )
+
+
+def server_timing(recorder, elapsed):
+    timing = (
+        f'db;dur={recorder.duration * 1000:.2f};'
+        f'desc="{recorder.count} queries", '
+        f'app;dur={elapsed * 1000:.2f}'
+    )
+    repeated = recorder.repeated()
+    if repeated:
+        timing += f', nplusone;desc="{max(repeated.values())} repeats"'
+    return timing
+
+
+class SQLProfilingMiddleware:
+    """Замер SQL для доли запросов; выключена при нулевой доле."""
+
+    def __init__(self, get_response):
+        if not settings.SQL_PROFILE_SAMPLE_RATE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.SQL_PROFILE_SAMPLE_RATE:
+            return self.get_response(request)
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        record(match.view_name if match else 'unresolved', recorder)
+        response['Server-Timing'] = server_timing(recorder, elapsed)
+        return response
@@ -0,0 +1,315 @@
+"""Сборка и раздача статики.
+
+collectstatic с CompressedManifestStaticFilesStorage:
+
+* вырезает из CSS из STATIC_PURGE_FILES правила с классами, которых нет
+  в шаблонах STATIC_PURGE_TEMPLATES (и в STATIC_PURGE_SAFELIST);
+* добавляет к именам хеш содержимого (ManifestStaticFilesStorage);
+* кладёт рядом сжатые копии .gz и, если установлен brotli, .br.
+
+StaticFilesMiddleware раздаёт собранное из STATIC_ROOT: выбирает готовую
+сжатую копию по Accept-Encoding и отдаёт файлы с хешем в имени с
+заголовком «хранить вечно». Сжатия во время запроса нет.
+"""
+import gzip
+import json
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.txt', '.ico', '.json', '.map')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Файлы без хеша в имени могут поменяться при следующей сборке.
+MUTABLE = 'public, max-age=60'
+# Расширение сжатой копии по Content-Encoding, в порядке предпочтения.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+TOKEN = re.compile(r'[\w-]+')
+CLASS = re.compile(r'\.(-?[_a-zA-Z][\w-]*)')
+# Строки и селекторы атрибутов: точки в них — не классы.
+NOT_CLASSES = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|\[[^\]]*\]')
+# Строки, комментарии и скобки — всё, что нужно для разбора по правилам.
+SYNTAX = re.compile(
+    r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|/\*.*?\*/|[{};]', re.S
+)
+# Правила внутри этих блоков чистятся так же, как на верхнем уровне.
+NESTED = ('@media', '@supports', '@layer')
+
+
+def used_tokens(directories):
+    """Все слова шаблонов, похожие на имена классов.
+
+    Разбор шаблонов не нужен: класс может собираться из переменных и
+    фильтров, а лишнее слово только оставит лишнее правило.
+    """
+    tokens = set(settings.STATIC_PURGE_SAFELIST)
+    for directory in directories:
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name.endswith(('.html', '.txt')):
+                    with open(os.path.join(root, name), encoding='utf-8') as f:
+                        tokens.update(TOKEN.findall(f.read()))
+    return tokens
+
+
+def _skip_string(css, i):
+    quote = css[i]
+    i += 1
+    while i < len(css) and css[i] != quote:
+        i += 2 if css[i] == '\\' else 1
+    return i
+
+
+def _top_level(css, start, match):
+    """Точка с запятой или комментарий вне блоков: (правило или None,
+    откуда начинается следующее)."""
+    before = css[start:match.start()].strip()
+    token = match.group()
+    if token == ';':
+        return (before + ';' if before else None), match.end()
+    if before:
+        # Комментарий внутри прелюдии остаётся её частью.
+        return None, start
+    return (token if token.startswith('/*!') else None), match.end()
+
+
+def _rules(css):
+    """Правила одного уровня: (прелюдия, тело); у @charset тело None,
+    у сохраняемого комментария /*! — прелюдия сам комментарий."""
+    depth = start = body = 0
+    prelude = ''
+    for match in SYNTAX.finditer(css):
+        token = match.group()
+        if token == '{':
+            if depth == 0:
+                prelude, body = css[start:match.start()].strip(), match.end()
+            depth += 1
+        elif token == '}':
+            depth -= 1
+            if depth == 0:
+                yield prelude, css[body:match.start()]
+                start = match.end()
+        elif depth == 0 and token[0] in ';/':
+            rule, start = _top_level(css, start, match)
+            if rule:
+                yield rule, None
+
+
+def _split_selectors(prelude):
+    parts, depth, start, i = [], 0, 0, 0
+    while i < len(prelude):
+        char = prelude[i]
+        if char in '"\'':
+            i = _skip_string(prelude, i)
+        elif char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parts.append(prelude[start:i])
+            start = i + 1
+        i += 1
+    parts.append(prelude[start:])
+    return [part.strip() for part in parts]
+
+
+def _is_used(selector, used):
+    if '\\' in selector:
+        return True
+    classes = CLASS.findall(NOT_CLASSES.sub('', selector))
+    return all(name in used for name in classes)
+
+
+def purge_css(css, used):
+    """CSS без правил, все селекторы которых ссылаются на неиспользуемые
+    классы. @media и @supports чистятся внутри и пропадают, если
+    опустели; остальные @-правила остаются как есть."""
+    output = []
+    for prelude, body in _rules(css):
+        if body is None:
+            output.append(prelude)
+        elif prelude.startswith(NESTED):
+            inner = purge_css(body, used)
+            if inner:
+                output.append(f'{prelude}{{{inner}}}')
+        elif prelude.startswith('@'):
+            output.append(f'{prelude}{{{body}}}')
+        else:
+            selectors = [
+                selector for selector in _split_selectors(prelude)
+                if _is_used(selector, used)
+            ]
+            if selectors:
+                output.append(f'{",".join(selectors)}{{{body}}}')
+    return ''.join(output)
+
+
+def compress(path):
+    """Записать рядом с файлом .gz и .br, если они меньше оригинала.
+
+    Возвращает пути записанных копий.
+    """
+    with open(path, 'rb') as source:
+        content = source.read()
+    written = []
+    variants = [('.gz', lambda data: gzip.compress(data, 9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', lambda data: brotli.compress(data)))
+    for suffix, encode in variants:
+        compressed = encode(content)
+        if len(compressed) < len(content):
+            with open(path + suffix, 'wb') as output:
+                output.write(compressed)
+            written.append(path + suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage с чисткой CSS и сжатыми копиями."""
+    manifest_strict = False
+
+    def stored_name(self, name):
+        # Без манифеста (collectstatic не запускали: тесты, разработка)
+        # ссылки ведут на исходные имена, а не падают.
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+        purge = [name for name in settings.STATIC_PURGE_FILES if name in paths]
+        if purge:
+            used = used_tokens(settings.STATIC_PURGE_TEMPLATES)
+            for name in purge:
+                # Из исходника: собранная копия уже могла быть вычищена
+                # по старым шаблонам, а collectstatic её не перезапишет.
+                storage, path = paths[name]
+                with storage.open(path) as source:
+                    css = source.read().decode('utf-8')
+                with open(self.path(name), 'w', encoding='utf-8') as output:
+                    output.write(purge_css(css, used))
+                # Хеш и копия с хешем строятся уже из вычищенного файла.
+                paths[name] = (self, name)
+        processed = []
+        for name, hashed_name, done in super().post_process(
+                paths, dry_run, **options):
+            processed.append(hashed_name)
+            yield name, hashed_name, done
+        for name in sorted({*paths, *processed} - {None}):
+            if name.endswith(COMPRESSIBLE):
+                for path in compress(self.path(name)):
+                    yield name, os.path.relpath(path, self.location), True
+
+
+class StaticFile:
+    """Собранный файл и его готовые сжатые копии."""
+
+    def __init__(self, path, immutable):
+        self.path = path
+        stat = os.stat(path)
+        self.size = stat.st_size
+        self.last_modified = stat.st_mtime
+        self.content_type = (
+            mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        )
+        self.cache_control = IMMUTABLE if immutable else MUTABLE
+        self.variants = [
+            (encoding, path + suffix, os.stat(path + suffix).st_size)
+            for encoding, suffix in ENCODINGS
+            if os.path.exists(path + suffix)
+        ]
+
+    def choose(self, accept_encoding):
+        """Путь, размер и Content-Encoding лучшего подходящего варианта."""
+        accepted = {
+            part.split(';')[0].strip()
+            for part in accept_encoding.split(',')
+            if not part.replace(' ', '').endswith(';q=0')
+        }
+        for encoding, path, size in self.variants:
+            if encoding in accepted:
+                return path, size, encoding
+        return self.path, self.size, None
+
+
+def scan(root):
+    """Файлы STATIC_ROOT по URL-пути. Неизменными считаются имена с
+    хешем из манифеста."""
+    try:
+        with open(os.path.join(root, 'staticfiles.json')) as manifest:
+            hashed = set(json.load(manifest)['paths'].values())
+    except (OSError, ValueError, KeyError):
+        hashed = set()
+    suffixes = tuple(suffix for _, suffix in ENCODINGS)
+    files = {}
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if name.endswith(suffixes) or name == 'staticfiles.json':
+                continue
+            path = os.path.join(directory, name)
+            url = os.path.relpath(path, root).replace(os.sep, '/')
+            files[url] = StaticFile(path, url in hashed)
+    return files
+
+
+class StaticFilesMiddleware:
+    """Раздача собранной статики из процесса приложения.
+
+    Список файлов читается из STATIC_ROOT один раз при запуске; без
+    собранной статики middleware отключается и статику, как обычно,
+    раздаёт runserver.
+    """
+
+    def __init__(self, get_response):
+        root = settings.STATIC_ROOT
+        if not root or not os.path.isdir(root):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL
+        self.files = scan(root)
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and \
+                request.path_info.startswith(self.prefix):
+            static = self.files.get(request.path_info[len(self.prefix):])
+            if static is not None:
+                return self.serve(request, static)
+        return self.get_response(request)
+
+    def serve(self, request, static):
+        if not was_modified_since(
+            request.META.get('HTTP_IF_MODIFIED_SINCE'),
+            static.last_modified, static.size,
+        ):
+            response = HttpResponseNotModified()
+        else:
+            path, size, encoding = static.choose(
+                request.META.get('HTTP_ACCEPT_ENCODING', '')
+            )
+            if request.method == 'HEAD':
+                response = HttpResponse(content_type=static.content_type)
+            else:
+                response = FileResponse(
+                    open(path, 'rb'), content_type=static.content_type
+                )
+            response['Content-Length'] = size
+            if encoding:
+                response['Content-Encoding'] = encoding
+        if static.variants:
+            response['Vary'] = 'Accept-Encoding'
+        response['Cache-Control'] = static.cache_control
+        response['Last-Modified'] = http_date(static.last_modified)
+        return response
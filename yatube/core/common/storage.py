@@ -0,0 +1,94 @@
+"""Хранилище файлов, названных по содержимому.
+
+Файл получает имя по sha256 своего содержимого и кладётся во вложенные
+каталоги по первым символам хеша: ``posts/ab/cd/abcd….jpg``. Одинаковые
+загрузки дают одно имя и хранятся один раз, а каталоги остаются
+небольшими при любом числе файлов.
+"""
+import hashlib
+import os
+import uuid
+
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+CHUNK_SIZE = 64 * 1024
+
+
+def content_hash(content):
+    """sha256 файла; посчитанный при загрузке берётся готовым."""
+    digest = getattr(content, 'sha256', None)
+    if digest:
+        return digest
+    hasher = hashlib.sha256()
+    for chunk in content.chunks(CHUNK_SIZE):
+        hasher.update(chunk)
+    content.seek(0)
+    return hasher.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, где имя файла — хеш его содержимого.
+
+    Каталог из upload_to сохраняется, имя и расширение исходного файла
+    заменяются. Повторная запись того же содержимого файл не пишет, а
+    только обновляет его время изменения: по нему сборщик мусора не
+    трогает файлы, на которые вот-вот сошлётся новая запись в базе.
+    """
+
+    def __init__(self, depth=2, width=2, **kwargs):
+        super().__init__(**kwargs)
+        self.depth = depth
+        self.width = width
+
+    def hashed_name(self, name, content):
+        directory, filename = os.path.split(name)
+        digest = content_hash(content)
+        shards = [
+            digest[i * self.width:(i + 1) * self.width]
+            for i in range(self.depth)
+        ]
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(directory, *shards, digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            os.utime(full_path)
+            return name.replace('\\', '/')
+        return self._save(name, content)
+
+    def _save(self, name, content):
+        """Записать во временный файл рядом и атомарно переименовать.
+
+        Два процесса с одинаковым содержимым пишут одно и то же, поэтому
+        победа любого из них при переименовании верна.
+        """
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        if self.directory_permissions_mode is not None:
+            os.chmod(directory, self.directory_permissions_mode)
+        temporary = os.path.join(directory, f'.{uuid.uuid4().hex}.tmp')
+        try:
+            if hasattr(content, 'temporary_file_path'):
+                file_move_safe(content.temporary_file_path(), temporary)
+            else:
+                with open(temporary, 'wb') as output:
+                    for chunk in content.chunks(CHUNK_SIZE):
+                        output.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temporary, self.file_permissions_mode)
+            os.replace(temporary, full_path)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+        return name.replace('\\', '/')
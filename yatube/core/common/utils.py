@@ -1,8 +1,29 @@
-from django.core.paginator import Paginator
+from django.conf import settings
 
+from .paginator import (CachedCountPaginator, CursorPaginator,
+                        MergedCursorPaginator)
 
-def paginate(request, object):
-    page = Paginator(object, 10)
-    page_num = request.GET.get('page')
-    page_obj = page.get_page(page_num)
+POSTS_PER_PAGE = 10
+
+
+def paginate(request, object, count_key=None, keys=('pub_date', 'pk')):
+    if settings.POSTS_PAGINATION == 'elided':
+        paginator = CachedCountPaginator(
+            object,
+            POSTS_PER_PAGE,
+            count_key=count_key,
+            timeout=settings.POSTS_COUNT_CACHE_TIMEOUT,
+        )
+        return paginator.get_page(request.GET.get('page'))
+    paginator = CursorPaginator(object, POSTS_PER_PAGE, keys=keys)
+    page_obj = paginator.get_cursor_page(
+        request.GET.get('cursor'), request.GET.get('page')
+    )
     return page_obj
+
+
+def paginate_merged(request, sources):
+    paginator = MergedCursorPaginator(sources, POSTS_PER_PAGE)
+    return paginator.get_cursor_page(
+        request.GET.get('cursor'), request.GET.get('page')
+    )
@@ -0,0 +1,29 @@
+"""Пул процессов для работы вне запроса.
+
+fork из процесса с потоками (пул ASGI_THREADS, потоки сервера) копирует
+память такой, какой её оставили другие потоки, вместе с захваченными
+ими блокировками, и процесс пула может зависнуть на первой же из них.
+Поэтому процессы рождаются от отдельного чистого процесса (forkserver)
+и настраивают Django сами.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+
+
+def setup(settings_module):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
+
+def process_pool(workers):
+    """ProcessPoolExecutor, в процессах которого Django уже настроен."""
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('forkserver'),
+        initializer=setup,
+        initargs=(settings.SETTINGS_MODULE,),
+    )
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 
 
 class CreatedModel(models.Model):
@@ -11,3 +11,15 @@ class CreatedModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class AtomicSaveModel(models.Model):
+    """Абстрактная модель. Сохраняет запись вместе с обработчиками
+    post_save в одной транзакции."""
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+    class Meta:
+        abstract = True
@@ -0,0 +1,98 @@
+import asyncio
+
+from django.core.wsgi import get_wsgi_application
+from django.http import StreamingHttpResponse
+from django.test import SimpleTestCase
+
+from core.common.asgi import ASGIHandler
+
+
+def call(application, scope, chunks=(b'',)):
+    """Выполнить HTTP-запрос к ASGI-приложению; тело — куски chunks."""
+    incoming = [
+        {
+            'type': 'http.request', 'body': chunk,
+            'more_body': i < len(chunks) - 1,
+        }
+        for i, chunk in enumerate(chunks)
+    ]
+    sent = []
+
+    async def receive():
+        return incoming.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'query_string': b'', 'headers': [], **scope}
+    asyncio.run(application(scope, receive, send))
+    return sent
+
+
+class ASGIHandlerTests(SimpleTestCase):
+    def test_request_reaches_wsgi_application(self):
+        def echo(environ, start_response):
+            start_response('201 Created', [('X-Path', environ['PATH_INFO'])])
+            return [
+                environ['QUERY_STRING'].encode(), b'|',
+                environ['HTTP_COOKIE'].encode(), b'|',
+                environ['CONTENT_TYPE'].encode(), b'|',
+                environ['wsgi.input'].read(),
+            ]
+
+        sent = call(ASGIHandler(echo, 2), {
+            'method': 'POST',
+            'path': '/posts/',
+            'query_string': b'page=2',
+            'headers': [
+                (b'cookie', b'a=1'), (b'cookie', b'b=2'),
+                (b'content-type', b'text/plain'),
+            ],
+        }, chunks=(b'first ', b'second'))
+        self.assertEqual(sent[0]['status'], 201)
+        self.assertIn((b'x-path', b'/posts/'), sent[0]['headers'])
+        body = b''.join(message.get('body', b'') for message in sent[1:])
+        self.assertEqual(body, b'page=2|a=1; b=2|text/plain|first second')
+
+    def test_django_page(self):
+        sent = call(
+            ASGIHandler(get_wsgi_application(), 2),
+            {
+                'method': 'GET', 'path': '/about/author/',
+                'headers': [(b'host', b'testserver')],
+            },
+        )
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn(b'</html>', sent[1]['body'])
+        self.assertFalse(sent[1].get('more_body'))
+
+    def test_stream_runs_in_loop_until_disconnect(self):
+        class Ticker(StreamingHttpResponse):
+            async def asgi_stream(self, send, run_sync):
+                for tick in range(1000):
+                    await send(await run_sync(str(tick).encode))
+                    await asyncio.sleep(0.01)
+
+        def application(environ, start_response):
+            start_response('200 OK', [])
+            return Ticker(iter(()))
+
+        incoming = [{'type': 'http.request'}]
+        sent = []
+
+        async def receive():
+            if incoming:
+                return incoming.pop(0)
+            await asyncio.sleep(0.05)
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(ASGIHandler(application, 2)(
+            {'type': 'http', 'method': 'GET', 'path': '/', 'headers': []},
+            receive, send,
+        ))
+        bodies = [message['body'] for message in sent[1:]]
+        self.assertEqual(bodies[:2], [b'0', b'1'])
+        self.assertLess(len(bodies), 20)
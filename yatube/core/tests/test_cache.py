@@ -0,0 +1,116 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from django.test import SimpleTestCase
+
+from core.common import invalidation
+from core.common.cache import SQLiteCache
+
+
+def increment(location, times):
+    cache = SQLiteCache(location, {})
+    for _ in range(times):
+        cache.incr('counter')
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = SQLiteCache(
+            self.location,
+            {'OPTIONS': {'MAX_BYTES': 10_000, 'ACCESS_RESOLUTION': 0}},
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_shared_between_instances(self):
+        """Запись видна другому экземпляру с тем же файлом."""
+        self.cache.set('key', {'value': 1})
+        other = SQLiteCache(self.location, {})
+        self.assertEqual(other.get('key'), {'value': 1})
+
+    def test_expiry_and_add(self):
+        """Просроченная запись не читается и не мешает add."""
+        self.cache.set('key', 'old', 0.05)
+        self.assertFalse(self.cache.add('key', 'new'))
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 'new'))
+        self.assertEqual(self.cache.get('key'), 'new')
+
+    def test_evicts_least_recently_read_by_size(self):
+        """При переполнении удаляются давно не читанные записи."""
+        for i in range(5):
+            self.cache.set(f'key{i}', 'x' * 1500)
+        self.cache.get('key0')
+        for i in range(5, 8):
+            self.cache.set(f'key{i}', 'x' * 1500)
+        self.assertLessEqual(self.cache.size(), 10_000)
+        self.assertIsNotNone(self.cache.get('key0'))
+        self.assertIsNone(self.cache.get('key1'))
+        self.assertIsNotNone(self.cache.get('key7'))
+
+    def test_incr_is_atomic_across_processes(self):
+        """Счётчик не теряет увеличения из разных процессов."""
+        self.cache.set('counter', 0)
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=increment, args=(self.location, 200))
+            for _ in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(self.cache.get('counter'), 800)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_incr_many_starts_missing_counters(self):
+        """incr_many создаёт отсутствующие и просроченные счётчики."""
+        self.cache.set('expired', 10, 0.05)
+        self.cache.set('kept', 5)
+        time.sleep(0.1)
+        self.assertEqual(
+            self.cache.incr_many({'expired': 1, 'kept': 2, 'new': 3}),
+            {'expired': 1, 'kept': 7, 'new': 3},
+        )
+        self.assertEqual(
+            self.cache.get_many(['expired', 'kept', 'new']),
+            {'expired': 1, 'kept': 7, 'new': 3},
+        )
+
+
+def bump_in_child(namespace, *keys):
+    invalidation.bump(namespace, *keys)
+
+
+class InvalidationBusTests(SimpleTestCase):
+    def bump_elsewhere(self, namespace, *keys):
+        process = multiprocessing.get_context('fork').Process(
+            target=bump_in_child, args=(namespace, *keys)
+        )
+        process.start()
+        process.join()
+
+    def test_bump_from_other_process_drops_local_value(self):
+        """Сброс в другом процессе виден без TTL."""
+        cache = invalidation.LocalCache('test-namespace')
+        self.assertEqual(cache.get_or_set('a', lambda: 1), 1)
+        self.assertEqual(cache.get_or_set('a', lambda: 2), 1)
+        self.bump_elsewhere('test-namespace')
+        self.assertEqual(cache.get_or_set('a', lambda: 3), 3)
+
+    def test_key_bump_keeps_other_keys(self):
+        """Сброс ключа не трогает остальные ключи пространства."""
+        cache = invalidation.LocalCache('test-keys')
+        cache.get_or_set('a', lambda: 'a')
+        cache.get_or_set('b', lambda: 'b')
+        self.bump_elsewhere('test-keys', 'a')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 'b')
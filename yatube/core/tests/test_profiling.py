@@ -0,0 +1,78 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core.common import profiling
+from posts.models import Comment, Post
+
+User = get_user_model()
+
+
+class FingerprintTests(TestCase):
+    def test_in_lists_of_any_length_match(self):
+        self.assertEqual(
+            profiling.fingerprint('SELECT 1 WHERE id IN (%s, %s, %s)'),
+            profiling.fingerprint('SELECT 1 WHERE id IN (%s)'),
+        )
+
+    def test_repeated_query_is_flagged(self):
+        users = [User.objects.create_user(username=f'u{i}') for i in range(5)]
+        recorder = profiling.QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for user in users:
+                User.objects.get(pk=user.pk)
+            User.objects.count()
+        self.assertEqual(recorder.count, 6)
+        self.assertEqual(list(recorder.repeated().values()), [5])
+
+
+@override_settings(SQL_PROFILE_SAMPLE_RATE=1)
+class SQLProfilingMiddlewareTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.staff = User.objects.create_user(username='staff', is_staff=True)
+        cls.post = Post.objects.create(author=cls.staff, text='Пост')
+        for i in range(6):
+            Comment.objects.create(
+                post=cls.post, text='-',
+                author=User.objects.create_user(username=f'reader{i}'),
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(SQLProfilingMiddlewareTests.staff)
+
+    def test_detail_has_no_nplusone(self):
+        """Авторы комментариев загружаются вместе с ними."""
+        response = self.client.get(reverse(
+            'post:post_detail',
+            kwargs={'post_id': SQLProfilingMiddlewareTests.post.pk},
+        ))
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertNotIn('nplusone', response['Server-Timing'])
+        stats = profiling.profile_stats()['post:post_detail']
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['nplusone'], 0)
+
+    def test_staff_endpoint(self):
+        recorder = profiling.QueryRecorder()
+        recorder.count = 7
+        recorder.fingerprints['SELECT %s'] = 7
+        profiling.record('posts:slow', recorder)
+        response = self.client.get(reverse('sql_profile'))
+        stats = response.json()['posts:slow']
+        self.assertEqual(stats['queries'], 7)
+        self.assertEqual(stats['nplusone'], 1)
+        self.assertEqual(stats['repeated'], {'SELECT %s': 7})
+        self.client.post(reverse('sql_profile'))
+        self.assertNotIn('posts:slow', profiling.profile_stats())
+
+    def test_endpoint_is_staff_only(self):
+        client = Client()
+        client.force_login(User.objects.create_user(username='reader'))
+        response = client.get(reverse('sql_profile'))
+        self.assertEqual(response.status_code, 302)
@@ -0,0 +1,83 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from core.common.staticfiles import (IMMUTABLE, MUTABLE,
+                                     StaticFilesMiddleware, compress,
+                                     purge_css)
+
+
+class PurgeCssTests(SimpleTestCase):
+    def test_unused_rules_are_dropped(self):
+        css = (
+            '@charset "UTF-8";/*! license */.btn,.unused{color:red}'
+            '.unused{color:blue}a[href^=".x"]{color:green}'
+            '@media (min-width:1px){.unused{margin:0}}'
+            '@media print{.card .btn{margin:0}}'
+            '@keyframes spin{from{opacity:0}}'
+        )
+        self.assertEqual(
+            purge_css(css, {'btn', 'card'}),
+            '@charset "UTF-8";/*! license */.btn{color:red}'
+            'a[href^=".x"]{color:green}'
+            '@media print{.card .btn{margin:0}}'
+            '@keyframes spin{from{opacity:0}}',
+        )
+
+    def test_strings_and_comments_do_not_break_rules(self):
+        css = '/* { */.a::after{content:"}"}.b{content:";"}'
+        self.assertEqual(purge_css(css, {'a'}), '.a::after{content:"}"}')
+
+
+class StaticFilesMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root, 'css'))
+        for name in ('app.css', 'app.0123456789ab.css'):
+            path = os.path.join(self.root, 'css', name)
+            with open(path, 'w') as output:
+                output.write('.a{color:red}' * 100)
+            compress(path)
+        manifest = {'paths': {'css/app.css': 'css/app.0123456789ab.css'}}
+        with open(os.path.join(self.root, 'staticfiles.json'), 'w') as f:
+            json.dump(manifest, f)
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def get(self, path, **headers):
+        with override_settings(STATIC_ROOT=self.root, STATIC_URL='/static/'):
+            middleware = StaticFilesMiddleware(lambda request: None)
+        return middleware(self.factory.get(path, **headers))
+
+    def test_hashed_file_is_immutable_and_precompressed(self):
+        response = self.get(
+            '/static/css/app.0123456789ab.css',
+            HTTP_ACCEPT_ENCODING='gzip, deflate',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['Cache-Control'], IMMUTABLE)
+        self.assertEqual(response['Content-Type'], 'text/css')
+        body = gzip.decompress(b''.join(response.streaming_content))
+        self.assertEqual(body, b'.a{color:red}' * 100)
+
+    def test_plain_name_is_revalidated(self):
+        response = self.get('/static/css/app.css')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['Cache-Control'], MUTABLE)
+        not_modified = self.get(
+            '/static/css/app.css',
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+        )
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_other_paths_pass_through(self):
+        self.assertIsNone(self.get('/static/css/missing.css'))
+        self.assertIsNone(self.get('/'))
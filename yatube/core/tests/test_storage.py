@@ -0,0 +1,40 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase
+
+from core.common.storage import ContentAddressedStorage
+
+
+class ContentAddressedStorageTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.storage = ContentAddressedStorage(location=self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_name_is_sharded_content_hash(self):
+        digest = hashlib.sha256(b'content').hexdigest()
+        name = self.storage.save('posts/Photo.JPG', ContentFile(b'content'))
+        self.assertEqual(
+            name, f'posts/{digest[:2]}/{digest[2:4]}/{digest}.jpg'
+        )
+        with self.storage.open(name) as saved:
+            self.assertEqual(saved.read(), b'content')
+
+    def test_same_content_stored_once(self):
+        """Повторная запись того же содержимого файл не дублирует."""
+        first = self.storage.save('posts/a.jpg', ContentFile(b'same'))
+        os.utime(self.storage.path(first), (0, 0))
+        second = self.storage.save('posts/b.jpg', ContentFile(b'same'))
+        self.assertEqual(first, second)
+        self.assertEqual(
+            os.listdir(os.path.dirname(self.storage.path(first))),
+            [os.path.basename(first)],
+        )
+        # Время изменения обновлено: сборщик мусора файл не тронет.
+        self.assertGreater(self.storage.get_modified_time(first).year, 1970)
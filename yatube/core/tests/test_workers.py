@@ -0,0 +1,27 @@
+import os
+import threading
+
+from django.apps import apps
+from django.test import SimpleTestCase
+
+from core.common.workers import process_pool
+
+
+def worker_state():
+    return os.getpid(), apps.ready, threading.active_count()
+
+
+class ProcessPoolTests(SimpleTestCase):
+    def test_workers_start_clean_with_django_ready(self):
+        """Процесс пула не наследует потоков родителя и готов к работе
+        с моделями."""
+        stop = threading.Event()
+        busy = threading.Thread(target=stop.wait)
+        busy.start()
+        self.addCleanup(busy.join)
+        self.addCleanup(stop.set)
+        with process_pool(1) as pool:
+            pid, ready, threads = pool.submit(worker_state).result(60)
+        self.assertNotEqual(pid, os.getpid())
+        self.assertTrue(ready)
+        self.assertEqual(threads, 1)
@@ -1,5 +1,9 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
 from django.shortcuts import render
 
+from core.common import profiling
+
 
 def page_not_found(request, exception):
     return render(request, 'core/404.html', {'path': request.path}, status=404)
@@ -15,3 +19,13 @@ def server_error(request):
 
 def permission_denied(request, exception):
     return render(request, 'core/403.html', status=403)
+
+
+@staff_member_required
+def sql_profile(request):
+    """Итоги профилирования SQL по view; POST обнуляет их."""
+    if request.method == 'POST':
+        profiling.reset_stats()
+    return JsonResponse(
+        profiling.profile_stats(), json_dumps_params={'ensure_ascii': False}
+    )
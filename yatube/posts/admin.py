@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.contrib import admin
 
-from .models import Comment, Group, Post, Follow
+from . import search
+from .models import AuthorStats, Comment, Group, Post, Follow
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -10,6 +12,16 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term or not search.is_available():
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        found = search.search_ids(
+            search_term, settings.SEARCH_RESULTS_LIMIT
+        )
+        return queryset.filter(pk__in=[pk for pk, _ in found]), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('title', 'slug',)
@@ -28,7 +40,17 @@ class FollowAdmin(admin.ModelAdmin):
     list_display = ('user', 'author')
 
 
+class AuthorStatsAdmin(admin.ModelAdmin):
+    list_display = (
+        'user', 'posts_count', 'comments_count',
+        'followers_count', 'following_count',
+    )
+    search_fields = ('user__username',)
+    readonly_fields = list_display[1:]
+
+
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Comment, CommentAdmin)
 admin.site.register(Follow, FollowAdmin)
+admin.site.register(AuthorStats, AuthorStatsAdmin)
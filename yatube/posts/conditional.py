@@ -0,0 +1,124 @@
+"""Условные GET для лент и страницы поста.
+
+Валидаторы считаются до отрисовки: поколения лент из кеша (те же, что у
+кеша страниц) и одна выборка по индексу с отметкой последних изменений.
+Клиент с актуальной копией получает 304 без шаблона и выборки постов.
+
+ETag учитывает пользователя и адрес: страницы разные для каждого
+посетителя. Удаление последнего поста отметку не сдвигает, поэтому
+его ловит ETag (поколение или число записей), а Last-Modified только
+дополняет его для клиентов без If-None-Match.
+"""
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, Max
+from django.utils.cache import (get_conditional_response,
+                                patch_cache_control)
+from django.utils.http import http_date, quote_etag
+
+from . import feeds, timeline
+from .models import Post, TimelineEntry
+
+
+def make_etag(request, *parts):
+    user = request.user.pk if request.user.is_authenticated else 'anon'
+    source = ':'.join(map(str, (*parts, user, request.get_full_path())))
+    return quote_etag(hashlib.md5(source.encode()).hexdigest())
+
+
+def condition(validators):
+    """Отвечать 304, если у клиента страница с теми же валидаторами.
+
+    validators(request, *args, **kwargs) возвращает (etag, last_modified)
+    или None, если страницы нет и решать должен сам view.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            found = validators(request, *args, **kwargs)
+            if found is None:
+                return view(request, *args, **kwargs)
+            etag, last_modified = found
+            timestamp = (
+                int(last_modified.timestamp()) if last_modified else None
+            )
+            response = get_conditional_response(
+                request, etag=etag, last_modified=timestamp
+            )
+            if response is None:
+                response = view(request, *args, **kwargs)
+            if response.status_code not in (200, 304):
+                return response
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+            # Свежесть проверяется при каждом показе: это дёшево.
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
+
+
+def feed(request, page, posts):
+    """Валидаторы закешированной ленты: поколения её страниц и
+    последнее изменение постов."""
+    generation = feeds.generations([feeds.EVERYTHING, page])
+    last_modified = posts.aggregate(last=Max('updated'))['last']
+    return make_etag(request, generation, last_modified), last_modified
+
+
+def index(request):
+    return feed(request, feeds.INDEX, Post.objects.all())
+
+
+def group_posts(request, slug):
+    return feed(
+        request, feeds.group_page(slug),
+        Post.objects.filter(group__slug=slug),
+    )
+
+
+def profile(request, username):
+    return feed(
+        request, feeds.profile_page(username),
+        Post.objects.filter(author__username=username),
+    )
+
+
+def follow_index(request):
+    """Поколения подписок пользователя и его авторов (те же, что у числа
+    постов ленты) и голова его материализованной ленты.
+
+    Без Last-Modified: правка поста и посты знаменитостей голову ленты
+    не сдвигают, их видно только по поколениям в ETag.
+    """
+    authors, _ = timeline.followed_authors(request.user)
+    generation = feeds.generations([
+        feeds.EVERYTHING,
+        feeds.follow_scope(request.user.pk),
+        *(feeds.author_scope(author_id) for author_id in sorted(authors)),
+    ])
+    head = TimelineEntry.objects.filter(user=request.user).aggregate(
+        last=Max('pub_date'), newest=Max('post')
+    )
+    return make_etag(request, *generation, *head.values()), None
+
+
+def post_detail(request, post_id):
+    """Пост, его комментарии и счётчик постов автора одной выборкой."""
+    found = Post.objects.filter(pk=post_id).order_by().values(
+        'updated', 'author__stats__posts_count'
+    ).annotate(
+        last_comment=Max('comments__created'), comments=Count('comments')
+    ).first()
+    if found is None:
+        return None
+    generation = feeds.generations([feeds.EVERYTHING])
+    last_modified = max(filter(None, (
+        found['updated'], found['last_comment']
+    )))
+    etag = make_etag(request, generation, *found.values())
+    return etag, last_modified
@@ -0,0 +1,166 @@
+"""Уведомления о новых постах в ленте подписок (server-sent events).
+
+Публикация поста увеличивает поколение автора на шине инвалидации
+(core.common.invalidation) — общей памяти всех воркеров машины. Под
+ASGI соединения ждут в цикле событий: одна задача процесса (Hub)
+раз в FOLLOW_EVENTS_POLL_INTERVAL сверяет поколения авторов, на которых
+подписаны слушатели, и будит только тех, чьих авторов это касается.
+Простаивающее соединение не занимает ни потока, ни запросов к базе,
+поэтому их могут быть тысячи на воркер.
+
+Под WSGI поток занимать нельзя: ответ отдаёт текущее состояние и
+просит браузер переподключиться через FOLLOW_EVENTS_RETRY мс.
+"""
+import asyncio
+import json
+import weakref
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import StreamingHttpResponse
+
+from core.common import invalidation
+
+from .models import Follow, Post
+
+NAMESPACE = 'author_posts'
+# Смена подписок пользователя (см. signals.follow_changed).
+FOLLOW = 'follow'
+
+
+def publish(post):
+    invalidation.bump(NAMESPACE, post.author_id)
+
+
+def followed(user_id):
+    return list(
+        Follow.objects.filter(user_id=user_id)
+        .values_list('author_id', flat=True)
+    )
+
+
+def count_new(user_id, after):
+    """Число постов подписок новее поста after."""
+    return Post.objects.filter(
+        author__following__user_id=user_id, pk__gt=after
+    ).count()
+
+
+def pooled(func, *args):
+    """Выполнить func в потоке пула вне запроса и, как после запроса,
+    закрыть устаревшее соединение с базой."""
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+def message(after, count):
+    data = json.dumps({'count': count})
+    return f'id: {after}\nevent: posts\ndata: {data}\n\n'.encode()
+
+
+class Hub:
+    """Слушатели ключей шины в цикле событий процесса."""
+    _hubs = weakref.WeakKeyDictionary()
+
+    def __init__(self):
+        self.listeners = {}
+        self.task = None
+
+    @classmethod
+    def current(cls):
+        loop = asyncio.get_running_loop()
+        if loop not in cls._hubs:
+            cls._hubs[loop] = cls()
+        return cls._hubs[loop]
+
+    def watch(self, keys, wake):
+        for key in keys:
+            self.listeners.setdefault(key, set()).add(wake)
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self.run())
+
+    def unwatch(self, keys, wake):
+        for key in keys:
+            waiting = self.listeners.get(key, set())
+            waiting.discard(wake)
+            if not waiting:
+                self.listeners.pop(key, None)
+
+    async def run(self):
+        seen = {}
+        while self.listeners:
+            for key in list(self.listeners):
+                current = invalidation.generation(*key)
+                if seen.setdefault(key, current) != current:
+                    seen[key] = current
+                    for wake in self.listeners.get(key, ()):
+                        wake.set()
+            for key in set(seen) - set(self.listeners):
+                del seen[key]
+            await asyncio.sleep(settings.FOLLOW_EVENTS_POLL_INTERVAL)
+
+
+class EventStream(StreamingHttpResponse):
+    """Поток событий о новых постах для пользователя user_id.
+
+    Под ASGI core.common.asgi.ASGIHandler вызывает asgi_stream в цикле
+    событий; обычная итерация (WSGI) отдаёт одно событие и retry.
+    """
+
+    def __init__(self, user_id, after):
+        super().__init__(
+            self.snapshot(user_id, after), content_type='text/event-stream'
+        )
+        self['Cache-Control'] = 'no-cache'
+        # Чтобы прокси вроде nginx не копили поток в буфере.
+        self['X-Accel-Buffering'] = 'no'
+        self.user_id = user_id
+        self.after = after
+
+    @staticmethod
+    def snapshot(user_id, after):
+        yield f'retry: {settings.FOLLOW_EVENTS_RETRY}\n\n'.encode()
+        count = count_new(user_id, after)
+        if count:
+            yield message(after, count)
+
+    @staticmethod
+    async def wait(wake, send):
+        """Дождаться пробуждения; по таймауту — отправить комментарий,
+        чтобы прокси не закрыли тихое соединение, и вернуть False."""
+        try:
+            await asyncio.wait_for(
+                wake.wait(), settings.FOLLOW_EVENTS_KEEPALIVE
+            )
+        except asyncio.TimeoutError:
+            await send(b': keepalive\n\n')
+            return False
+        return True
+
+    async def asgi_stream(self, send, run_sync):
+        hub = Hub.current()
+        wake = asyncio.Event()
+        keys = set()
+        last = None
+        try:
+            while True:
+                authors = await run_sync(pooled, followed, self.user_id)
+                watched = {(FOLLOW, self.user_id)} | {
+                    (NAMESPACE, author_id) for author_id in authors
+                }
+                hub.unwatch(keys - watched, wake)
+                hub.watch(watched - keys, wake)
+                keys = watched
+                count = await run_sync(
+                    pooled, count_new, self.user_id, self.after
+                )
+                if count != last:
+                    await send(message(self.after, count))
+                    last = count
+                while not await self.wait(wake, send):
+                    pass
+                wake.clear()
+        finally:
+            hub.unwatch(keys, wake)
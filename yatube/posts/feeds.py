@@ -0,0 +1,111 @@
+"""Ленты постов и их ключи в кеше.
+
+Лента («scope») — главная страница, группа, автор или подписки
+пользователя. Всё, что кешируется для ленты, строится от её имени.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+
+from .models import Group
+
+INDEX = 'index'
+# Поколение всех страниц: меняется при правке групп и имён авторов.
+EVERYTHING = 'all'
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def author_scope(author_id):
+    return f'author:{author_id}'
+
+
+def follow_scope(user_id):
+    return f'follow:{user_id}'
+
+
+def count_key(scope):
+    return f'posts_count:{scope}'
+
+
+def post_scopes(post, group_ids=()):
+    """Все ленты, в которые попадает пост, кроме лент подписок: их
+    число постов ключуется поколениями (follow_count_key)."""
+    scopes = [INDEX, author_scope(post.author_id)]
+    scopes += [
+        group_scope(group_id)
+        for group_id in {post.group_id, *group_ids} if group_id
+    ]
+    return scopes
+
+
+def invalidate_counts(scopes):
+    cache.delete_many([count_key(scope) for scope in scopes])
+
+
+def follow_count_key(user_id, author_ids):
+    """Ключ числа постов в ленте подписок пользователя.
+
+    Ключ на подписчика пришлось бы удалять у всех подписчиков при каждом
+    посте автора. Вместо этого в ключ входят поколения подписок
+    пользователя и каждого его автора: пост сдвигает одно поколение
+    автора, а старые ключи истекают сами.
+    """
+    stamp = generations([
+        follow_scope(user_id),
+        *(author_scope(author_id) for author_id in sorted(author_ids)),
+    ])
+    digest = hashlib.md5(':'.join(map(str, stamp)).encode()).hexdigest()
+    return f'{count_key(follow_scope(user_id))}:{digest}'
+
+
+def group_page(slug):
+    return f'group_page:{slug}'
+
+
+def profile_page(username):
+    return f'profile_page:{username}'
+
+
+def generation_key(scope):
+    return f'feed_generation:{scope}'
+
+
+def generations(scopes):
+    """Текущие поколения лент.
+
+    Пропавший из кеша счётчик начинается заново со времени, а не с нуля,
+    чтобы не совпасть со старым поколением и не поднять устаревшие
+    страницы.
+    """
+    keys = [generation_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def bump(scopes):
+    for scope in set(scopes):
+        key = generation_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def post_pages(post, group_ids=()):
+    """Закешированные страницы, на которых показан пост."""
+    slugs = Group.objects.filter(
+        pk__in={post.group_id, *group_ids} - {None}
+    ).values_list('slug', flat=True)
+    return [
+        INDEX,
+        profile_page(post.author.username),
+        *(group_page(slug) for slug in slugs),
+    ]
@@ -1,13 +1,59 @@
+import os
+from functools import partial
+
+from django import forms
+from django.core.files.uploadedfile import UploadedFile
 from django.forms import ModelForm
 
+from . import uploads
 from .models import Comment, Post
 
 
+def image_to_python(field, data):
+    """Разбор картинки, уже проверенной uploads.ImageUploadHandler.
+
+    Такой файл Pillow повторно не открывает; файлы, пришедшие в обход
+    обработчика, проверяются обычным ImageField.to_python.
+    """
+    if getattr(data, 'image_probe', None) is None and \
+            getattr(data, 'upload_error', None) is None:
+        return forms.ImageField.to_python(field, data)
+    if data.upload_error is not None:
+        raise forms.ValidationError(data.upload_error, code='invalid_image')
+    data = forms.FileField.to_python(field, data)
+    data.content_type = data.image_probe.content_type
+    data.name = os.path.splitext(data.name)[0] + data.image_probe.extension
+    return data
+
+
 class PostForm(ModelForm):
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Поле остаётся ImageField, меняется только разбор файла.
+        image = self.fields['image']
+        image.to_python = partial(image_to_python, image)
+
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        if getattr(image, 'image_probe', None) is not None:
+            image = uploads.normalize(image)
+        if image is False:
+            self.set_details({
+                'image_width': None, 'image_height': None,
+                'image_placeholder': '',
+            })
+        elif isinstance(image, UploadedFile):
+            self.set_details(uploads.details(image))
+        return image
+
+    def set_details(self, details):
+        for field, value in details.items():
+            setattr(self.instance, field, value)
+
 
 class CommentForm(ModelForm):
     class Meta:
@@ -0,0 +1,98 @@
+import multiprocessing
+import os
+import random
+import tempfile
+from time import perf_counter
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core.common.cache import SQLiteCache
+
+
+def make_locmem(location):
+    return LocMemCache('benchmark', {'OPTIONS': {'MAX_ENTRIES': 10 ** 6}})
+
+
+def make_sqlite(location):
+    return SQLiteCache(location, {'OPTIONS': {'MAX_BYTES': 256 * 1024 ** 2}})
+
+
+BACKENDS = {
+    'locmem': make_locmem,
+    'sqlite': make_sqlite,
+}
+
+
+def worker(make_cache, location, options, seed, results):
+    """Чтение страницы из кеша, при промахе — запись, как у cache_page."""
+    cache = make_cache(location)
+    rng = random.Random(seed)
+    payload = os.urandom(options['value_size'])
+    hits = stored = 0
+    started = perf_counter()
+    for _ in range(options['ops']):
+        key = f'page:{rng.randrange(options["keys"])}'
+        if cache.get(key) is None:
+            cache.set(key, payload, None)
+            stored += 1
+        else:
+            hits += 1
+        if not cache.add('counter', 1, None):
+            cache.incr('counter')
+    elapsed = perf_counter() - started
+    results.put((hits, stored, elapsed, cache.get('counter')))
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает LocMemCache и общий кеш на SQLite при нескольких '
+        'процессах: скорость, долю попаданий, число копий записей '
+        'и точность счётчика.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument(
+            '--ops', type=int, default=2000,
+            help='Сколько обращений делает каждый процесс.'
+        )
+        parser.add_argument(
+            '--keys', type=int, default=200,
+            help='Сколько разных страниц запрашивается.'
+        )
+        parser.add_argument('--value-size', type=int, default=4096)
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context('fork')
+        self.stdout.write(
+            f'{"backend":<8}{"ops/s":>10}{"hit rate":>10}'
+            f'{"copies/key":>12}{"counter":>10}{"expected":>10}'
+        )
+        for name, make_cache in BACKENDS.items():
+            with tempfile.TemporaryDirectory() as directory:
+                location = os.path.join(directory, 'cache.sqlite3')
+                results = context.Queue()
+                processes = [
+                    context.Process(
+                        target=worker,
+                        args=(make_cache, location, options, seed, results),
+                    )
+                    for seed in range(options['workers'])
+                ]
+                for process in processes:
+                    process.start()
+                rows = [results.get() for _ in processes]
+                for process in processes:
+                    process.join()
+            hits = sum(row[0] for row in rows)
+            stored = sum(row[1] for row in rows)
+            total = options['ops'] * options['workers']
+            # Обращения идут параллельно: считаем по самому медленному.
+            ops = total / max(row[2] for row in rows)
+            counter = max(row[3] for row in rows)
+            self.stdout.write(
+                f'{name:<8}{ops:>10.0f}{hits / total:>10.1%}'
+                f'{stored / options["keys"]:>12.2f}{counter:>10}'
+                f'{total:>10}'
+            )
@@ -0,0 +1,259 @@
+import json
+import os
+import time
+from datetime import datetime, timezone
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix, del_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from posts import media
+from posts.models import MediaFile, Post, ThumbnailUsage
+
+PHASES = ('originals', 'sources', 'thumbnails')
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет файлы картинок, на которые не ссылается ни один пост '
+        '(счётчик ссылок MediaFile равен нулю дольше --grace), и '
+        'миниатюры таких картинок. Медиа и хранилище sorl читаются пачками; '
+        'прогон можно ограничить --limit и продолжить со следующего.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено; контрольная точка '
+                 'не сохраняется.'
+        )
+        parser.add_argument(
+            '--grace', type=int, default=60 * 60,
+            help='Не трогать файлы, изменённые за столько секунд.'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=0,
+            help='Сколько записей проверить за прогон; 0 — все.'
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--checkpoint', default=settings.MEDIA_GC_CHECKPOINT,
+            help='Файл, в котором запоминается, где остановился прогон.'
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать сначала, не глядя на контрольную точку.'
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.dry_run = options['dry_run']
+        self.deadline = time.time() - options['grace']
+        self.released_before = datetime.fromtimestamp(
+            self.deadline, timezone.utc
+        )
+        self.left = options['limit'] or None
+        field = Post._meta.get_field('image')
+        self.storage = field.storage
+        self.upload_to = field.upload_to
+        checkpoint = {} if options['restart'] else self.load_checkpoint()
+        if checkpoint:
+            self.stdout.write(
+                f'Продолжение: этап {checkpoint["phase"]} '
+                f'после {checkpoint["after"] or "начала"}'
+            )
+        start = PHASES.index(checkpoint.get('phase', PHASES[0]))
+        for index, phase in enumerate(PHASES[start:], start):
+            after = checkpoint.get('after') if index == start else None
+            if not getattr(self, f'collect_{phase}')(after):
+                self.stdout.write(
+                    f'Достигнут --limit, следующий прогон продолжит '
+                    f'этап {phase}.'
+                )
+                return
+            if index + 1 < len(PHASES):
+                self.save_checkpoint(PHASES[index + 1], None)
+        if not self.dry_run and os.path.exists(options['checkpoint']):
+            os.remove(options['checkpoint'])
+
+    def run(self, phase, items, key, collect):
+        """Проверить записи этапа пачками с учётом --limit.
+
+        collect(пачка) перечисляет найденное как (имя, байты); после
+        каждой пачки запоминается её последняя запись. False — этап
+        прерван по --limit.
+        """
+        found = checked = size = 0
+        finished = True
+        for chunk in chunked(items, self.options['batch_size']):
+            if self.left is not None:
+                if not self.left:
+                    finished = False
+                    break
+                chunk = chunk[:self.left]
+                self.left -= len(chunk)
+            checked += len(chunk)
+            for name, weight in collect(chunk):
+                found += 1
+                size += weight
+                if self.options['verbosity'] > 1:
+                    self.stdout.write(f'  {name}')
+            self.save_checkpoint(phase, key(chunk[-1]))
+        verb = 'к удалению' if self.dry_run else 'удалено'
+        self.stdout.write(
+            f'{phase}: проверено {checked}, {verb} {found} '
+            f'({size / 1024:.0f} КиБ)'
+        )
+        return finished
+
+    def collect_originals(self, after):
+        """Оригиналы без ссылок из постов."""
+        def collect(chunk):
+            fresh = [
+                (name, stat) for name, stat in chunk
+                if stat.st_mtime < self.deadline
+            ]
+            alive = media.in_use(
+                [name for name, _ in fresh], self.released_before
+            )
+            for name, stat in fresh:
+                if name in alive:
+                    continue
+                if not self.dry_run:
+                    self.storage.delete(name)
+                    MediaFile.objects.filter(name=name).delete()
+                    ThumbnailUsage.objects.filter(name=name).delete()
+                yield name, stat.st_size
+
+        return self.run(
+            'originals',
+            media.walk(self.storage, self.upload_to, after),
+            key=lambda item: item[0],
+            collect=collect,
+        )
+
+    def collect_sources(self, after):
+        """Миниатюры картинок, которых больше нет у постов.
+
+        Мёртвым считается и источник, записанный с другим хранилищем:
+        после смены хранилища поля sorl ищет миниатюры по новым ключам.
+        """
+        prefix = add_prefix('', 'thumbnails')
+
+        def keys():
+            last = prefix + (after or '')
+            while True:
+                page = list(
+                    KVStoreModel.objects.filter(
+                        key__startswith=prefix, key__gt=last
+                    ).order_by('key').values_list('key', flat=True)[
+                        :self.options['batch_size']
+                    ]
+                )
+                if not page:
+                    return
+                yield from (del_prefix(key) for key in page)
+                last = page[-1]
+
+        def collect(chunk):
+            sources = {key: default.kvstore._get(key) for key in chunk}
+            sources = {
+                key: source.name
+                if source and self.is_field_storage(source) else None
+                for key, source in sources.items()
+            }
+            alive = media.in_use(
+                [name for name in sources.values() if name],
+                self.released_before,
+            )
+            for key, name in sources.items():
+                if name not in alive:
+                    yield from self.drop_thumbnails(key)
+
+        return self.run(
+            'sources', keys(), key=lambda key: key, collect=collect
+        )
+
+    def collect_thumbnails(self, after):
+        """Файлы миниатюр, о которых не знает хранилище sorl."""
+        storage = default.storage
+
+        def collect(chunk):
+            fresh = [
+                (name, stat) for name, stat in chunk
+                if stat.st_mtime < self.deadline
+            ]
+            keys = {
+                add_prefix(ImageFile(name, storage).key): (name, stat)
+                for name, stat in fresh
+            }
+            known = set(
+                KVStoreModel.objects.filter(key__in=list(keys))
+                .values_list('key', flat=True)
+            )
+            for key, (name, stat) in keys.items():
+                if key in known:
+                    continue
+                if not self.dry_run:
+                    storage.delete(name)
+                yield name, stat.st_size
+
+        return self.run(
+            'thumbnails',
+            media.walk(storage, thumbnail_settings.THUMBNAIL_PREFIX, after),
+            key=lambda item: item[0],
+            collect=collect,
+        )
+
+    def drop_thumbnails(self, key):
+        """Миниатюры источника с ключом key и его записи в sorl."""
+        kvstore = default.kvstore
+        for thumbnail_key in kvstore._get(key, identity='thumbnails') or []:
+            thumbnail = kvstore._get(thumbnail_key)
+            if thumbnail is None:
+                continue
+            weight = (
+                thumbnail.storage.size(thumbnail.name)
+                if thumbnail.exists() else 0
+            )
+            if not self.dry_run:
+                kvstore.delete(thumbnail, False)
+                thumbnail.delete()
+            yield thumbnail.name, weight
+        if not self.dry_run:
+            kvstore._delete(key, identity='thumbnails')
+            kvstore._delete(key)
+
+    def is_field_storage(self, source):
+        return isinstance(source.storage, type(self.storage))
+
+    def load_checkpoint(self):
+        try:
+            with open(self.options['checkpoint']) as checkpoint:
+                return json.load(checkpoint)
+        except FileNotFoundError:
+            return {}
+
+    def save_checkpoint(self, phase, after):
+        if self.dry_run:
+            return
+        os.makedirs(
+            os.path.dirname(os.path.abspath(self.options['checkpoint'])),
+            exist_ok=True,
+        )
+        with open(self.options['checkpoint'], 'w') as checkpoint:
+            json.dump({'phase': phase, 'after': after}, checkpoint)
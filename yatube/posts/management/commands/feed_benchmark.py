@@ -0,0 +1,99 @@
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from posts import timeline
+from posts.models import Follow, Post, TimelineEntry
+
+User = get_user_model()
+
+# Число подписчиков у каждого автора.
+DISTRIBUTIONS = {
+    'uniform': [100] * 20,
+    'skewed': [2000] + [50] * 19,
+    'long-tail': [2000, 1000, 500, 250] + [10] * 16,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает стоимость записи и чтения ленты подписок при раздаче '
+        'постов, сборке при чтении и гибриде. Все данные создаются '
+        'в транзакции и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--posts', type=int, default=5,
+            help='Сколько постов публикует каждый автор.'
+        )
+        parser.add_argument(
+            '--readers', type=int, default=20,
+            help='Для скольких подписчиков замеряется чтение ленты.'
+        )
+        parser.add_argument(
+            '--threshold', type=int, default=1000,
+            help='Порог знаменитости для гибридной схемы.'
+        )
+
+    def handle(self, *args, **options):
+        strategies = {
+            'push': 10 ** 9,
+            'hybrid': options['threshold'],
+            'pull': 1,
+        }
+        self.stdout.write(
+            f'{"distribution":<14}{"strategy":<9}{"write ms/post":>15}'
+            f'{"rows/post":>11}{"read ms/page":>14}{"queries":>9}'
+        )
+        for name, followers in DISTRIBUTIONS.items():
+            for strategy, threshold in strategies.items():
+                with override_settings(FEED_CELEBRITY_THRESHOLD=threshold):
+                    row = self.run(followers, options)
+                self.stdout.write(
+                    f'{name:<14}{strategy:<9}{row[0]:>15.2f}'
+                    f'{row[1]:>11.1f}{row[2]:>14.2f}{row[3]:>9.1f}'
+                )
+
+    def run(self, followers, options):
+        with transaction.atomic():
+            User.objects.bulk_create(
+                User(username=f'bench-reader-{i:05}')
+                for i in range(max(followers))
+            )
+            User.objects.bulk_create(
+                User(username=f'bench-author-{i:05}')
+                for i in range(len(followers))
+            )
+            users = User.objects.order_by('username')
+            readers = list(users.filter(username__startswith='bench-reader'))
+            authors = list(users.filter(username__startswith='bench-author'))
+            Follow.objects.bulk_create(
+                Follow(user=reader, author=author)
+                for author, count in zip(authors, followers)
+                for reader in readers[:count]
+            )
+            total = len(authors) * options['posts']
+            started = perf_counter()
+            for i in range(options['posts']):
+                for author in authors:
+                    Post.objects.create(author=author, text=f'Пост {i}')
+            write = (perf_counter() - started) * 1000 / total
+            rows = TimelineEntry.objects.count() / total
+
+            factory = RequestFactory()
+            sample = readers[:options['readers']]
+            started = perf_counter()
+            with CaptureQueriesContext(connection) as queries:
+                for reader in sample:
+                    request = factory.get('/follow/')
+                    request.user = reader
+                    list(timeline.paginate_feed(request, reader))
+            read = (perf_counter() - started) * 1000 / len(sample)
+            result = (write, rows, read, len(queries) / len(sample))
+            transaction.set_rollback(True)
+        return result
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from posts import page_cache
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания, промахи и устаревшие ответы кеша лент.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Обнулить счётчики после вывода.',
+        )
+
+    def handle(self, *args, **options):
+        stats = page_cache.cache_stats()
+        total = sum(stats.values())
+        for counter, value in stats.items():
+            share = value / total if total else 0
+            self.stdout.write(f'{counter}: {value} ({share:.1%})')
+        if options['reset']:
+            page_cache.reset_stats()
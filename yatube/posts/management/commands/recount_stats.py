@@ -0,0 +1,51 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.models import AuthorStats
+from posts.stats import COUNTERS, with_actual_counts
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счётчики пользователей по таблицам постов, '
+        'комментариев и подписок и сообщает о расхождениях.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить: ничего не менять и завершиться '
+                 'с ошибкой, если счётчики разошлись.'
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        stored = {}
+        drifted = 0
+        users = with_actual_counts(User.objects.order_by('pk'))
+        for user in users.iterator(chunk_size=options['batch_size']):
+            if not stored:
+                stored = self.stored_batch(user.pk, options['batch_size'])
+            actual = {
+                field: getattr(user, f'actual_{field}') for field in COUNTERS
+            }
+            current = stored.pop(user.pk, None)
+            if current == actual:
+                continue
+            drifted += 1
+            self.stdout.write(f'{user.username}: {current} -> {actual}')
+            if not options['check']:
+                AuthorStats.objects.update_or_create(
+                    user_id=user.pk, defaults=actual
+                )
+        self.stdout.write(f'Расхождений: {drifted}')
+        if drifted and options['check']:
+            raise CommandError('Счётчики пользователей разошлись.')
+
+    def stored_batch(self, first_pk, size):
+        rows = AuthorStats.objects.filter(
+            user_id__gte=first_pk
+        ).order_by('user_id').values('user_id', *COUNTERS)[:size]
+        return {row.pop('user_id'): row for row in rows}
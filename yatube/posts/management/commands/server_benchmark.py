@@ -0,0 +1,116 @@
+import asyncio
+import io
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter, sleep
+
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+
+from core.common.asgi import ASGIHandler, environ_from_scope
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность WSGI и ASGI при многих '
+        'одновременных клиентах с одинаковым числом потоков. Клиенты '
+        'медленные: запрос и ответ идут по сети --network мс. Поток WSGI '
+        'это время ждёт, при ASGI его ждёт цикл событий.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=64)
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument(
+            '--requests', type=int, default=10,
+            help='Сколько запросов подряд делает каждый клиент.'
+        )
+        parser.add_argument(
+            '--network', type=float, default=50,
+            help='Передача запроса и ответа, мс в каждую сторону.'
+        )
+        parser.add_argument('--path', default='/')
+
+    def handle(self, *args, **options):
+        application = get_wsgi_application()
+        scope = {
+            'type': 'http',
+            'method': 'GET',
+            'path': options['path'],
+            'query_string': b'',
+            'headers': [(b'host', b'localhost')],
+        }
+        self.stdout.write(
+            f'{"server":<8}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}'
+        )
+        for name, run in (('wsgi', self.run_wsgi), ('asgi', self.run_asgi)):
+            started = perf_counter()
+            latencies = run(application, scope, options)
+            elapsed = perf_counter() - started
+            quantiles = statistics.quantiles(latencies, n=20)
+            self.stdout.write(
+                f'{name:<8}{len(latencies) / elapsed:>10.1f}'
+                f'{quantiles[9] * 1000:>10.1f}{quantiles[18] * 1000:>10.1f}'
+            )
+
+    def run_wsgi(self, application, scope, options):
+        """Поток сервера сам читает запрос и пишет ответ клиенту."""
+        network = options['network'] / 1000
+
+        def serve():
+            sleep(network)
+            environ = environ_from_scope(scope, io.BytesIO())
+            result = application(environ, lambda status, headers: None)
+            try:
+                b''.join(result)
+            finally:
+                result.close()
+            sleep(network)
+
+        latencies = []
+        with ThreadPoolExecutor(options['threads']) as server:
+            def client():
+                for _ in range(options['requests']):
+                    started = perf_counter()
+                    server.submit(serve).result()
+                    latencies.append(perf_counter() - started)
+
+            clients = [
+                threading.Thread(target=client)
+                for _ in range(options['clients'])
+            ]
+            for thread in clients:
+                thread.start()
+            for thread in clients:
+                thread.join()
+        return latencies
+
+    def run_asgi(self, application, scope, options):
+        network = options['network'] / 1000
+        handler = ASGIHandler(application, options['threads'])
+        latencies = []
+
+        async def receive():
+            await asyncio.sleep(network)
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            if message['type'] == 'http.response.body' and \
+                    not message.get('more_body'):
+                await asyncio.sleep(network)
+
+        async def client():
+            for _ in range(options['requests']):
+                started = perf_counter()
+                await handler(scope, receive, send)
+                latencies.append(perf_counter() - started)
+
+        async def main():
+            await asyncio.gather(
+                *(client() for _ in range(options['clients']))
+            )
+
+        asyncio.run(main())
+        handler.executor.shutdown()
+        return latencies
@@ -0,0 +1,98 @@
+import os
+import tempfile
+import uuid
+from contextlib import contextmanager
+from io import BytesIO
+from time import perf_counter
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from PIL import Image, ImageDraw
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.images import ImageFile
+
+from posts import thumbnails
+
+
+def sample_image(width, height):
+    """Картинка с градиентом и деталями, похожая на фотографию по сжатию."""
+    image = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    draw = ImageDraw.Draw(image)
+    step = max(width // 40, 1)
+    for x in range(0, width, step):
+        draw.line(
+            [(x, 0), (width - x, height)],
+            fill=(x % 256, 128, 255 - x % 256),
+        )
+    content = BytesIO()
+    image.save(content, 'JPEG', quality=90)
+    return content.getvalue()
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет построение вариантов картинки поста: время и размер '
+        'каждой ширины и формата. Файлы пишутся во временный каталог, '
+        'записи хранилища sorl откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--width', type=int, default=4000)
+        parser.add_argument('--height', type=int, default=3000)
+        parser.add_argument('--size', default='card', choices=thumbnails.SIZES)
+
+    def handle(self, *args, **options):
+        size = thumbnails.SIZES[options['size']]
+        data = sample_image(options['width'], options['height'])
+        self.stdout.write(
+            f'Оригинал {options["width"]}x{options["height"]}: '
+            f'{len(data) / 1024:.0f} КиБ; формат: {thumbnails.FORMAT}'
+        )
+        self.stdout.write(
+            f'{"format":<7}{"geometry":>11}{"ms":>9}{"KiB":>9}'
+        )
+        variants = [
+            (size.geometry(width), {'format': image_format, **size.options})
+            for width, image_format in size.variants()
+        ]
+        with self.media(data) as (media_root, name):
+            total = 0
+            for geometry, variant in variants:
+                started = perf_counter()
+                thumbnail = get_thumbnail(name, geometry, **variant)
+                elapsed = (perf_counter() - started) * 1000
+                total += elapsed
+                weight = os.path.getsize(
+                    os.path.join(media_root, thumbnail.name)
+                ) / 1024
+                self.stdout.write(
+                    f'{variant["format"]:<7}{geometry:>11}'
+                    f'{elapsed:>9.1f}{weight:>9.1f}'
+                )
+        self.stdout.write(f'get_thumbnail на каждый вариант: {total:.0f} мс')
+        with self.media(data) as (media_root, name):
+            started = perf_counter()
+            thumbnails.backend.build_many(name, variants)
+            total = (perf_counter() - started) * 1000
+        self.stdout.write(
+            f'build_many, одно уменьшенное декодирование: {total:.0f} мс'
+        )
+
+    @contextmanager
+    def media(self, data):
+        """Оригинал во временном MEDIA_ROOT.
+
+        Имя каждый раз новое, чтобы не найти миниатюры прошлого запуска в
+        кеше; записи sorl потом удаляются из кеша и откатываются в базе.
+        """
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root), \
+                transaction.atomic():
+            name = default_storage.save(
+                f'posts/benchmark-{uuid.uuid4().hex}.jpg', BytesIO(data)
+            )
+            yield media_root, name
+            default.kvstore.delete(ImageFile(name))
+            transaction.set_rollback(True)
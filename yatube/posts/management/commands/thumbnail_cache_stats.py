@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает долю показов с готовыми миниатюрами, вытеснения и '
+        'место, занятое миниатюрами, относительно бюджета.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--evict', action='store_true',
+            help='Сначала вытеснить миниатюры сверх бюджета.',
+        )
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Обнулить счётчики после вывода.',
+        )
+
+    def handle(self, *args, **options):
+        if options['evict']:
+            evicted = thumbnails.evict()
+            self.stdout.write(f'Вытеснено картинок: {evicted}')
+        stats = thumbnails.cache_stats()
+        shown = stats['hit'] + stats['miss']
+        share = stats['hit'] / shown if shown else 0
+        self.stdout.write(
+            f'hit: {stats["hit"]}, miss: {stats["miss"]} ({share:.1%})'
+        )
+        self.stdout.write(f'evicted: {stats["evicted"]}')
+        budget = stats['budget']
+        usage = f'{stats["bytes"] / 1024 ** 2:.1f} МиБ'
+        if budget:
+            usage += (
+                f' из {budget / 1024 ** 2:.0f} МиБ '
+                f'({stats["bytes"] / budget:.1%})'
+            )
+        self.stdout.write(f'Миниатюры {stats["images"]} картинок: {usage}')
+        if stats['oldest']:
+            self.stdout.write(f'Самый давний показ: {stats["oldest"]}')
+        if options['reset']:
+            thumbnails.reset_stats()
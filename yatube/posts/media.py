@@ -0,0 +1,83 @@
+"""Учёт ссылок постов на файлы картинок.
+
+Картинки лежат в хранилище по содержимому (см.
+core.common.storage.ContentAddressedStorage): одинаковые загрузки разных
+постов — один файл с одним набором миниатюр. Счётчик в MediaFile
+показывает, сколько постов на файл ссылается; файлы без ссылок
+удаляются не сразу, а сборщиком мусора (manage.py collect_media).
+
+Счётчик ведут сигналы Post, поэтому картинку поста меняют только через
+save() и delete(): массовые update() и bulk_create() ссылок не учтут.
+"""
+import os
+
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import MediaFile
+
+
+def acquire(name):
+    """Добавить ссылку на файл."""
+    if not name:
+        return
+    updated = MediaFile.objects.filter(name=name).update(
+        refs=F('refs') + 1, updated=timezone.now()
+    )
+    if not updated:
+        media, created = MediaFile.objects.get_or_create(
+            name=name, defaults={'refs': 1}
+        )
+        if not created:
+            MediaFile.objects.filter(pk=media.pk).update(
+                refs=F('refs') + 1, updated=timezone.now()
+            )
+
+
+def release(name):
+    """Убрать ссылку на файл; сам файл остаётся до сборки мусора."""
+    if name:
+        MediaFile.objects.filter(name=name, refs__gt=0).update(
+            refs=F('refs') - 1, updated=timezone.now()
+        )
+
+
+def walk(storage, directory, after=None):
+    """Файлы каталога хранилища по порядку имён: (имя, os.stat_result).
+
+    Каталоги читаются по одному, поэтому память не зависит от числа
+    файлов. С after начинается с файла, следующего за ним: ветви до него
+    пропускаются целиком. Скрытые (временные) файлы не возвращаются.
+    """
+    after = tuple(after.split('/')) if after else ()
+
+    def visit(parts):
+        try:
+            with os.scandir(storage.path('/'.join(parts))) as entries:
+                entries = sorted(entries, key=lambda entry: entry.name)
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            child = parts + (entry.name,)
+            if entry.name.startswith('.') or child < after[:len(child)]:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                yield from visit(child)
+            elif child != after:
+                yield '/'.join(child), entry.stat(follow_symlinks=False)
+
+    return visit(tuple(directory.strip('/').split('/')))
+
+
+def in_use(names, since):
+    """Те из имён, на которые ссылаются посты или ссылались позже since.
+
+    Файл без записи MediaFile не нужен ни одному посту: запись появляется
+    при сохранении поста с картинкой. Недавно загруженный файл, пост
+    которого ещё не сохранён, бережёт проверка времени изменения файла.
+    """
+    return set(
+        MediaFile.objects.filter(name__in=names)
+        .filter(Q(refs__gt=0) | Q(updated__gte=since))
+        .values_list('name', flat=True)
+    )
@@ -0,0 +1,68 @@
+# Generated by Django 2.2.16 on 2026-10-17 06:33
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_stats(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    counters = {
+        'posts_count': (apps.get_model('posts', 'Post'), 'author'),
+        'comments_count': (apps.get_model('posts', 'Comment'), 'author'),
+        'followers_count': (apps.get_model('posts', 'Follow'), 'author'),
+        'following_count': (apps.get_model('posts', 'Follow'), 'user'),
+    }
+    users = User.objects.annotate(**{
+        field: Coalesce(
+            Subquery(
+                model.objects.filter(
+                    **{link: OuterRef('pk')}
+                ).order_by().values(link).annotate(
+                    total=Count('pk')
+                ).values('total'),
+                output_field=IntegerField(),
+            ),
+            0,
+        )
+        for field, (model, link) in counters.items()
+    })
+    AuthorStats.objects.bulk_create(
+        (
+            AuthorStats(
+                user_id=user.pk,
+                **{field: getattr(user, field) for field in counters}
+            )
+            for user in users.iterator()
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0024_post_author_pub_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('posts_count', models.IntegerField(default=0, verbose_name='Постов')),
+                ('comments_count', models.IntegerField(default=0, verbose_name='Комментариев')),
+                ('followers_count', models.IntegerField(default=0, verbose_name='Подписчиков')),
+                ('following_count', models.IntegerField(default=0, verbose_name='Подписок')),
+            ],
+            options={
+                'verbose_name': 'Статистика автора',
+                'verbose_name_plural': 'Статистика авторов',
+            },
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
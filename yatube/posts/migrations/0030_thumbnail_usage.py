@@ -0,0 +1,26 @@
+# Generated by Django 2.2.16 on 2026-10-17 07:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0029_post_image_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThumbnailUsage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Картинка')),
+                ('size', models.BigIntegerField(default=0, verbose_name='Байт')),
+                ('accessed', models.DateTimeField(db_index=True, verbose_name='Последний показ')),
+            ],
+            options={
+                'verbose_name': 'Миниатюры картинки',
+                'verbose_name_plural': 'Миниатюры картинок',
+            },
+        ),
+    ]
@@ -1,12 +1,28 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
-from core.models import CreatedModel
+from core.common.storage import ContentAddressedStorage
+from core.models import AtomicSaveModel, CreatedModel
 
 User = get_user_model()
 
 
-class Post(CreatedModel):
+class PostQuerySet(models.QuerySet):
+    # Поля, которые выводят карточки постов в лентах.
+    FEED_FIELDS = (
+        'text', 'pub_date', 'updated', 'image', 'image_width',
+        'image_height', 'image_placeholder', 'author', 'group',
+        'author__username', 'author__first_name', 'author__last_name',
+        'group__slug', 'group__title',
+    )
+
+    def for_feed(self):
+        """Посты для лент: авторы и группы одним запросом,
+        только нужные шаблонам столбцы."""
+        return self.select_related('author', 'group').only(*self.FEED_FIELDS)
+
+
+class Post(AtomicSaveModel, CreatedModel):
     text = models.TextField(
         'Текст поста',
         help_text='Текст нового поста'
@@ -29,8 +45,22 @@ class Post(CreatedModel):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    # Заполняются при загрузке картинки (см. uploads.details).
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки', null=True, blank=True, editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки', null=True, blank=True, editable=False
+    )
+    image_placeholder = models.TextField(
+        'Заглушка картинки', blank=True, editable=False
+    )
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self):
         return self.text[:15]
@@ -39,6 +69,23 @@ class Post(CreatedModel):
         ordering = ["-pub_date"]
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='post_author_pub_date_idx',
+            ),
+            # Поиск постов по файлу картинки: счётчики и сборка мусора.
+            models.Index(fields=['image'], name='post_image_idx'),
+            # Последние изменения лент для условных GET.
+            models.Index(fields=['updated'], name='post_updated_idx'),
+            models.Index(
+                fields=['group', 'updated'], name='post_group_updated_idx'
+            ),
+            models.Index(
+                fields=['author', 'updated'],
+                name='post_author_updated_idx',
+            ),
+        ]
 
 
 class Group(models.Model):
@@ -50,7 +97,7 @@ class Group(models.Model):
         return self.title
 
 
-class Comment(models.Model):
+class Comment(AtomicSaveModel):
     post = models.ForeignKey(
         'Post',
         on_delete=models.CASCADE,
@@ -80,7 +127,7 @@ class Comment(models.Model):
         verbose_name_plural = 'Комментарии'
 
 
-class Follow(models.Model):
+class Follow(AtomicSaveModel):
     user = models.ForeignKey(
         User,
         related_name='follower',
@@ -99,3 +146,90 @@ class Follow(models.Model):
                 fields=['user', 'author'], name='unique_following'
             )
         ]
+
+
+class TimelineEntry(models.Model):
+    """Пост в ленте подписок пользователя.
+
+    Записи раскладываются при публикации поста всем подписчикам автора,
+    поэтому лента подписок читается одним проходом по индексу.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        db_table = 'timeline'
+        ordering = ['-pub_date', '-post']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_timeline_post'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_pub_date_idx',
+            )
+        ]
+
+
+class AuthorStats(models.Model):
+    """Счётчики пользователя, которые ведутся при изменении данных.
+
+    Пересчитать и проверить расхождения: ``manage.py recount_stats``.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь'
+    )
+    posts_count = models.IntegerField('Постов', default=0)
+    comments_count = models.IntegerField('Комментариев', default=0)
+    followers_count = models.IntegerField('Подписчиков', default=0)
+    following_count = models.IntegerField('Подписок', default=0)
+
+    class Meta:
+        verbose_name = 'Статистика автора'
+        verbose_name_plural = 'Статистика авторов'
+
+
+class MediaFile(models.Model):
+    """Число постов, ссылающихся на файл картинки.
+
+    Файлы хранятся по содержимому, и одинаковые картинки разных постов —
+    один файл. Удалить его можно, только когда ссылок не осталось.
+    """
+    name = models.CharField('Файл', max_length=255, unique=True)
+    refs = models.PositiveIntegerField('Ссылок', default=0)
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Медиафайл'
+        verbose_name_plural = 'Медиафайлы'
+
+
+class ThumbnailUsage(models.Model):
+    """Миниатюры картинки на диске: сколько места занимают и когда
+    их показывали в последний раз.
+
+    По этим записям вытесняются давно не показанные миниатюры, когда
+    все вместе они превышают THUMBNAIL_CACHE_MAX_BYTES.
+    """
+    name = models.CharField('Картинка', max_length=255, unique=True)
+    size = models.BigIntegerField('Байт', default=0)
+    accessed = models.DateTimeField('Последний показ', db_index=True)
+
+    class Meta:
+        verbose_name = 'Миниатюры картинки'
+        verbose_name_plural = 'Миниатюры картинок'
@@ -0,0 +1,110 @@
+"""Кеш страниц лент с защитой от одновременной пересборки.
+
+Страница хранится вместе с поколениями лент, для которых её отрисовали.
+Когда она устарела (по поколению или по времени), пересобирает её только
+запрос, взявший блокировку. Остальные тем временем отдают старую копию,
+если она ещё в окне stale-while-revalidate, или ждут свежую.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.common.counters import Counters
+
+from . import feeds
+
+counters = Counters('feed_page_stats', ('hit', 'miss', 'stale'))
+# Как часто запрос без старой копии проверяет, готова ли свежая.
+POLL_INTERVAL = 0.05
+
+
+def page_key(name, request):
+    user = request.user.pk if request.user.is_authenticated else 'anon'
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'feed_page:{name}:{user}:{path}'
+
+
+def cache_stats():
+    """Число попаданий, промахов и отданных устаревших копий."""
+    return counters.values()
+
+
+def reset_stats():
+    counters.reset()
+
+
+def is_fresh(entry, generation):
+    return (
+        entry is not None
+        and entry['generation'] == generation
+        and entry['fresh_until'] > time.time()
+    )
+
+
+def store(key, generation, response):
+    # Страницы, ставящие cookie, нельзя отдавать другим запросам.
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return
+    entry = {
+        'generation': generation,
+        'fresh_until': time.time() + settings.FEED_PAGE_CACHE_TIMEOUT,
+        'response': response,
+    }
+    cache.set(
+        key, entry,
+        settings.FEED_PAGE_CACHE_TIMEOUT + settings.FEED_PAGE_STALE_TIMEOUT
+    )
+
+
+def wait_for_fresh(key, generation):
+    deadline = time.monotonic() + settings.FEED_PAGE_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(key)
+        if is_fresh(entry, generation):
+            return entry
+    return None
+
+
+def cache_feed(scope):
+    """Кешировать страницу ленты до первой записи в неё.
+
+    scope — имя ленты или функция от аргументов view. Запись в ленту
+    меняет её поколение, и страница пересобирается при следующем запросе.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            name = scope(*args, **kwargs) if callable(scope) else scope
+            key = page_key(name, request)
+            generation = feeds.generations([feeds.EVERYTHING, name])
+            entry = cache.get(key)
+            if is_fresh(entry, generation):
+                counters.count(hit=1)
+                return entry['response']
+            lock = f'{key}:lock'
+            if cache.add(lock, 1, settings.FEED_PAGE_LOCK_TIMEOUT):
+                try:
+                    counters.count(miss=1)
+                    response = view(request, *args, **kwargs)
+                    store(key, generation, response)
+                    return response
+                finally:
+                    cache.delete(lock)
+            if entry is not None:
+                counters.count(stale=1)
+                return entry['response']
+            entry = wait_for_fresh(key, generation)
+            if entry is not None:
+                counters.count(hit=1)
+                return entry['response']
+            # Пересборка зависла дольше блокировки: отрисовать самим.
+            counters.count(miss=1)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,120 @@
+"""Полнотекстовый поиск по постам на SQLite FTS5.
+
+Индекс — виртуальная таблица posts_search, где rowid совпадает с id
+поста. Она обновляется сигналами при сохранении и удалении постов и
+пересобирается командой ``manage.py rebuild_search_index``. На других
+СУБД поиск откатывается к icontains.
+"""
+import re
+
+from django.db import connection, transaction
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+from django.utils.text import Truncator
+
+from .models import Post
+
+TABLE = 'posts_search'
+WORD_RE = re.compile(r'\w+')
+# Границы найденного фрагмента до экранирования HTML.
+MARK_START, MARK_END = '\x02', '\x03'
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def index_post(post):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT OR REPLACE INTO {TABLE}(rowid, text) VALUES (%s, %s)',
+            [post.pk, post.text],
+        )
+
+
+def unindex_post(post_id):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [post_id])
+
+
+def match_expression(query):
+    """Слова запроса как префиксы; синтаксис FTS5 из ввода не проходит."""
+    return ' '.join(f'"{word}"*' for word in WORD_RE.findall(query))
+
+
+def search_ids(query, limit):
+    """Id постов по убыванию релевантности и фрагменты с подсветкой."""
+    expression = match_expression(query)
+    if not expression:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid, snippet({TABLE}, 0, %s, %s, '…', 16) "
+            f'FROM {TABLE} WHERE {TABLE} MATCH %s '
+            f'ORDER BY bm25({TABLE}) LIMIT %s',
+            [MARK_START, MARK_END, expression, limit],
+        )
+        return cursor.fetchall()
+
+
+def highlight(snippet):
+    return mark_safe(
+        escape(snippet)
+        .replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>')
+    )
+
+
+def search(query, limit):
+    """Найденные посты с атрибутом snippet, самые релевантные первыми."""
+    if not is_available():
+        posts = list(
+            Post.objects.for_feed().filter(text__icontains=query)[:limit]
+        )
+        for post in posts:
+            post.snippet = Truncator(post.text).words(16)
+        return posts
+    found = search_ids(query, limit)
+    posts = Post.objects.for_feed().in_bulk([pk for pk, _ in found])
+    results = []
+    for pk, snippet in found:
+        if pk in posts:
+            posts[pk].snippet = highlight(snippet)
+            results.append(posts[pk])
+    return results
+
+
+def rebuild(batch_size=1000):
+    """Пересобрать индекс пачками; возвращает число постов в индексе.
+
+    Записи заменяются на месте, поэтому поиск работает и во время
+    пересборки.
+    """
+    if not is_available():
+        return 0
+    total, last_pk = 0, 0
+    while True:
+        batch = list(
+            Post.objects.filter(pk__gt=last_pk).order_by('pk')
+            .values_list('pk', 'text')[:batch_size]
+        )
+        if not batch:
+            break
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {TABLE}(rowid, text) '
+                'VALUES (%s, %s)',
+                batch,
+            )
+        total += len(batch)
+        last_pk = batch[-1][0]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {TABLE} WHERE rowid NOT IN '
+            '(SELECT id FROM posts_post)'
+        )
+    return total
@@ -0,0 +1,139 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from core.common import invalidation
+
+from . import events, feeds, media, search, stats, thumbnails, timeline
+from .models import AuthorStats, Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+NAME_FIELDS = ('username', 'first_name', 'last_name')
+
+
+@receiver(post_init, sender=User)
+def remember_name(sender, instance, **kwargs):
+    instance._initial_name = [
+        instance.__dict__.get(field) for field in NAME_FIELDS
+    ]
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        AuthorStats.objects.create(user=instance)
+    name = [getattr(instance, field) for field in NAME_FIELDS]
+    if not created and instance._initial_name != name:
+        # Имя автора есть на карточках во всех лентах.
+        feeds.bump([feeds.EVERYTHING])
+    instance._initial_name = name
+
+
+def image_name(image):
+    return getattr(image, 'name', image) or ''
+
+
+@receiver(post_init, sender=Post)
+def remember_state(sender, instance, **kwargs):
+    # Через __dict__, чтобы не подгружать отложенные поля.
+    instance._initial_group_id = instance.__dict__.get('group_id')
+    instance._initial_pub_date = instance.__dict__.get('pub_date')
+    instance._initial_text = instance.__dict__.get('text')
+    # None — картинка не загружена, и её смену не отследить.
+    instance._initial_image = (
+        image_name(instance.__dict__['image'])
+        if 'image' in instance.__dict__ else None
+    )
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    old_group_id = instance._initial_group_id
+    if created:
+        stats.change(instance.author_id, posts_count=1)
+        timeline.fan_out(instance)
+        events.publish(instance)
+    elif instance._initial_pub_date != instance.pub_date:
+        timeline.move(instance)
+    if created or old_group_id != instance.group_id:
+        feeds.invalidate_counts(
+            feeds.post_scopes(instance, group_ids=[old_group_id])
+        )
+    if created or instance._initial_text != instance.text:
+        search.index_post(instance)
+    image = image_name(instance.image)
+    old_image = '' if created else instance._initial_image
+    if old_image is not None and old_image != image:
+        media.acquire(image)
+        media.release(old_image)
+        thumbnails.schedule(instance.image)
+    feeds.bump(feeds.post_pages(instance, group_ids=[old_group_id]))
+    # Лента подписок: число постов и условный GET (см. conditional).
+    feeds.bump([feeds.author_scope(instance.author_id)])
+    instance._initial_group_id = instance.group_id
+    instance._initial_pub_date = instance.pub_date
+    instance._initial_text = instance.text
+    instance._initial_image = image
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    stats.change(instance.author_id, posts_count=-1)
+    media.release(instance._initial_image)
+    search.unindex_post(instance.pk)
+    feeds.invalidate_counts(feeds.post_scopes(instance))
+    feeds.bump([feeds.author_scope(instance.author_id)])
+    feeds.bump(feeds.post_pages(instance))
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        stats.change(instance.author_id, followers_count=1)
+        stats.change(instance.user_id, following_count=1)
+        timeline.backfill(instance.user_id, instance.author_id)
+        timeline.followers_changed(instance.author_id, 1)
+    feeds.bump([feeds.follow_scope(instance.user_id)])
+    follow_changed(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    stats.change(instance.author_id, followers_count=-1)
+    stats.change(instance.user_id, following_count=-1)
+    timeline.trim(instance.user_id, instance.author_id)
+    timeline.followers_changed(instance.author_id, -1)
+    feeds.bump([feeds.follow_scope(instance.user_id)])
+    follow_changed(instance)
+
+
+def follow_changed(follow):
+    # Счётчики подписок и кнопка подписки на страницах обоих профилей.
+    feeds.bump([
+        feeds.profile_page(follow.user.username),
+        feeds.profile_page(follow.author.username),
+    ])
+    invalidation.bump('follow', follow.user_id)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        stats.change(instance.author_id, comments_count=1)
+        feeds.bump([feeds.profile_page(instance.author.username)])
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    stats.change(instance.author_id, comments_count=-1)
+    feeds.bump([feeds.profile_page(instance.author.username)])
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # Ссылки на группу есть на главной и в профилях.
+    feeds.bump([feeds.EVERYTHING])
+    invalidation.bump('group')
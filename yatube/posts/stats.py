@@ -0,0 +1,64 @@
+"""Счётчики постов, комментариев и подписок пользователей."""
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import AuthorStats, Comment, Follow, Post
+
+User = get_user_model()
+
+# Поле счётчика: (модель, поле модели со ссылкой на пользователя).
+COUNTERS = {
+    'posts_count': (Post, 'author'),
+    'comments_count': (Comment, 'author'),
+    'followers_count': (Follow, 'author'),
+    'following_count': (Follow, 'user'),
+}
+
+
+def change(user_id, **deltas):
+    """Сдвинуть счётчики пользователя.
+
+    Отсутствующую запись не создаём: она будет посчитана заново при
+    первом чтении.
+    """
+    AuthorStats.objects.filter(user_id=user_id).update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+
+
+def with_actual_counts(users):
+    """Пользователи с посчитанными по таблицам значениями счётчиков."""
+    return users.annotate(**{
+        f'actual_{field}': Coalesce(
+            Subquery(
+                model.objects.filter(
+                    **{link: OuterRef('pk')}
+                ).order_by().values(link).annotate(
+                    total=Count('pk')
+                ).values('total'),
+                output_field=IntegerField(),
+            ),
+            0,
+        )
+        for field, (model, link) in COUNTERS.items()
+    })
+
+
+def recount(user):
+    counted = with_actual_counts(User.objects.filter(pk=user.pk)).get()
+    stats, _ = AuthorStats.objects.update_or_create(
+        user_id=user.pk,
+        defaults={
+            field: getattr(counted, f'actual_{field}')
+            for field in COUNTERS
+        },
+    )
+    return stats
+
+
+def stats_for(user):
+    try:
+        return user.stats
+    except AuthorStats.DoesNotExist:
+        return recount(user)
@@ -0,0 +1,16 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(image, size):
+    """Готовая миниатюра картинки; если её ещё нет — ставит в очередь."""
+    if not image:
+        return None
+    thumbnail = thumbnails.lookup(image, size)
+    if thumbnail is None:
+        thumbnails.schedule(image)
+    return thumbnail
@@ -1,18 +1,25 @@
+import hashlib
+import os
 import shutil
 import tempfile
+import time
+from io import BytesIO
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
 from django.urls import reverse
+from PIL import Image
 
-from ..models import Group, Post
+from ..models import Group, MediaFile, Post, ThumbnailUsage
 
-TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
 User = get_user_model()
 
 
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostCreateTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -78,6 +85,10 @@ class PostCreateTests(TestCase):
                 group=PostCreateTests.post.group.id
             ).exists()
         )
+        digest = hashlib.sha256(small_gif).hexdigest()
+        self.assertTrue(Post.objects.filter(
+            image=f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif'
+        ).exists())
 
     def test_edit_post(self):
         """Валидная форма в post_edit редактирует
@@ -108,3 +119,121 @@ class PostCreateTests(TestCase):
                 group=PostCreateTests.post.group.id
             ).exists()
         )
+
+
+def image_upload(name, size, image_format='JPEG', **params):
+    content = BytesIO()
+    Image.new('RGB', size, 'white').save(content, image_format, **params)
+    return SimpleUploadedFile(name, content.getvalue())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageUploadTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='uploader')
+
+    def setUp(self):
+        self.client.force_login(ImageUploadTests.user)
+
+    def create(self, image):
+        return self.client.post(
+            reverse('post:post_create'), {'text': 'Пост', 'image': image}
+        )
+
+    def image_errors(self, response):
+        return response.context['form'].errors.get('image')
+
+    @override_settings(POST_IMAGE_MAX_BYTES=1024)
+    def test_oversize_file_rejected(self):
+        """Файл больше POST_IMAGE_MAX_BYTES не принимается."""
+        response = self.create(image_upload('big.png', (400, 400), 'PNG'))
+        self.assertEqual(
+            self.image_errors(response), ['Файл слишком большой.']
+        )
+        self.assertFalse(Post.objects.exists())
+
+    def test_decompression_bomb_rejected_from_header(self):
+        """Огромная по пикселям картинка отсекается по заголовку."""
+        content = BytesIO()
+        Image.new('1', (20000, 20000)).save(content, 'PNG')
+        response = self.create(
+            SimpleUploadedFile('bomb.png', content.getvalue())
+        )
+        self.assertEqual(
+            self.image_errors(response), ['Картинка слишком большая.']
+        )
+
+    def test_not_an_image_rejected(self):
+        response = self.create(SimpleUploadedFile('text.jpg', b'x' * 1000))
+        self.assertEqual(self.image_errors(response), ['Загрузите картинку.'])
+
+    @override_settings(POST_IMAGE_MAX_SIDE=100)
+    def test_image_normalized_on_upload(self):
+        """Картинка поворачивается по EXIF и ужимается до максимума."""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        self.create(image_upload('photo.jpg', (400, 200), exif=exif))
+        post = Post.objects.get()
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (50, 100))
+            self.assertEqual(image.getexif().get(0x0112, 1), 1)
+        self.assertEqual((post.image_width, post.image_height), (50, 100))
+        self.assertTrue(
+            post.image_placeholder.startswith('data:image/png;base64,')
+        )
+
+    def test_small_image_kept_as_is(self):
+        upload = image_upload('small.png', (40, 20), 'PNG')
+        content = upload.read()
+        upload.seek(0)
+        self.create(upload)
+        post = Post.objects.get()
+        with open(post.image.path, 'rb') as saved:
+            self.assertEqual(saved.read(), content)
+
+    def test_identical_uploads_share_file(self):
+        """Одинаковые картинки — один файл и счётчик ссылок на него."""
+        for _ in range(2):
+            self.create(image_upload('photo.jpg', (40, 20)))
+        first, second = Post.objects.all()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(
+            os.listdir(os.path.dirname(first.image.path)),
+            [os.path.basename(first.image.name)],
+        )
+        media = MediaFile.objects.get(name=first.image.name)
+        self.assertEqual(media.refs, 2)
+        first.delete()
+        media.refresh_from_db()
+        self.assertEqual(media.refs, 1)
+        self.assertTrue(os.path.exists(second.image.path))
+
+
+class RuntimeFilesTests(TransactionTestCase):
+    def written_since(self, started):
+        return [
+            os.path.join(root, name)
+            for root, dirs, files in os.walk(settings.BASE_DIR)
+            if '__pycache__' not in root
+            for name in files
+            if os.stat(os.path.join(root, name)).st_mtime >= started
+        ]
+
+    def test_nothing_written_to_source_tree(self):
+        """Картинка, миниатюры после коммита, кеш и шина тестов лежат
+        вне дерева исходников."""
+        started = time.time() - 1
+        user = User.objects.create_user(username='uploader')
+        post = Post.objects.create(
+            author=user, text='Пост',
+            image=image_upload('photo.jpg', (40, 20)),
+        )
+        self.client.force_login(user)
+        self.client.get(reverse('post:index'))
+        self.assertTrue(
+            ThumbnailUsage.objects.filter(name=post.image.name).exists()
+        )
+        self.assertTrue(post.image.path.startswith(settings.MEDIA_ROOT))
+        self.assertEqual(self.written_since(started), [])
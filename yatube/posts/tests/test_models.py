@@ -1,7 +1,22 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from sorl.thumbnail import default
 
-from ..models import Group, Post
+from .. import thumbnails
+from ..models import (AuthorStats, Comment, Follow, Group, MediaFile, Post,
+                      TimelineEntry)
 
 User = get_user_model()
 
@@ -55,3 +70,178 @@ class PostModelTest(TestCase):
             with self.subTest(field=field):
                 self.assertEqual(
                     post._meta.get_field(field).help_text, expected_value)
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.old_post = Post.objects.create(
+            author=cls.author,
+            text='Старый пост',
+        )
+
+    def timeline(self):
+        return list(
+            TimelineEntry.objects.filter(
+                user=TimelineTest.reader
+            ).values_list('post__text', flat=True)
+        )
+
+    def test_timeline_follows_subscriptions(self):
+        """Лента заполняется при подписке и публикации
+        и очищается при отписке."""
+        follow = Follow.objects.create(
+            user=TimelineTest.reader, author=TimelineTest.author
+        )
+        self.assertEqual(self.timeline(), ['Старый пост'])
+        Post.objects.create(author=TimelineTest.author, text='Новый пост')
+        self.assertEqual(self.timeline(), ['Новый пост', 'Старый пост'])
+        follow.delete()
+        self.assertEqual(self.timeline(), [])
+
+
+class AuthorStatsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def stats(self, user):
+        return AuthorStats.objects.get(user=user)
+
+    def test_counters_follow_changes(self):
+        """Счётчики меняются вместе с постами, комментариями
+        и подписками."""
+        post = Post.objects.create(author=AuthorStatsTest.author, text='Пост')
+        Comment.objects.create(
+            post=post, author=AuthorStatsTest.reader, text='Комментарий'
+        )
+        follow = Follow.objects.create(
+            user=AuthorStatsTest.reader, author=AuthorStatsTest.author
+        )
+        author = self.stats(AuthorStatsTest.author)
+        reader = self.stats(AuthorStatsTest.reader)
+        self.assertEqual(author.posts_count, 1)
+        self.assertEqual(author.followers_count, 1)
+        self.assertEqual(reader.comments_count, 1)
+        self.assertEqual(reader.following_count, 1)
+        follow.delete()
+        post.delete()
+        author = self.stats(AuthorStatsTest.author)
+        reader = self.stats(AuthorStatsTest.reader)
+        self.assertEqual(author.posts_count, 0)
+        self.assertEqual(author.followers_count, 0)
+        self.assertEqual(reader.comments_count, 0)
+        self.assertEqual(reader.following_count, 0)
+
+    def test_recount_stats_fixes_drift(self):
+        Post.objects.create(author=AuthorStatsTest.author, text='Пост')
+        AuthorStats.objects.filter(user=AuthorStatsTest.author).update(
+            posts_count=7
+        )
+        with self.assertRaises(CommandError):
+            call_command('recount_stats', '--check', stdout=StringIO())
+        call_command('recount_stats', stdout=StringIO())
+        self.assertEqual(self.stats(AuthorStatsTest.author).posts_count, 1)
+        call_command('recount_stats', '--check', stdout=StringIO())
+
+
+class CollectMediaTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.media_root, 'gc.json')
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+    def post_with_image(self, color):
+        content = BytesIO()
+        Image.new('RGB', (64, 32), color).save(content, 'JPEG')
+        post = Post(author=CollectMediaTest.user, text='Пост')
+        post.image.save('photo.jpg', ContentFile(content.getvalue()))
+        return post
+
+    def collect(self, *args):
+        out = StringIO()
+        call_command(
+            'collect_media', '--grace=0', f'--checkpoint={self.checkpoint}',
+            *args, stdout=out,
+        )
+        return out.getvalue()
+
+    def test_unreferenced_original_and_thumbnails_removed(self):
+        kept = self.post_with_image('red')
+        dropped = self.post_with_image('blue')
+        for post in (kept, dropped):
+            thumbnails.generate(post.image.name)
+        files = thumbnails.variant_files(dropped.image, 'card').values()
+        dropped_path = dropped.image.path
+        dropped.delete()
+        stray = default.storage.save('cache/00/00/stray.jpg', ContentFile(b''))
+
+        report = self.collect('--dry-run')
+        self.assertIn('originals: проверено 2, к удалению 1', report)
+        self.assertTrue(os.path.exists(dropped_path))
+
+        self.collect()
+        self.assertFalse(os.path.exists(dropped_path))
+        self.assertTrue(os.path.exists(kept.image.path))
+        self.assertFalse(default.storage.exists(stray))
+        for thumbnail in files:
+            self.assertFalse(thumbnail.exists())
+            self.assertIsNone(default.kvstore.get(thumbnail))
+        for thumbnail in thumbnails.variant_files(kept.image, 'card').values():
+            self.assertTrue(thumbnail.exists())
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_released_file_kept_for_grace_period(self):
+        """Файл удаляется, только когда ссылок нет дольше --grace."""
+        post = self.post_with_image('red')
+        path = post.image.path
+        os.utime(path, (0, 0))
+        out = StringIO()
+        options = ['--grace=3600', f'--checkpoint={self.checkpoint}']
+        call_command('collect_media', *options, stdout=out)
+        self.assertTrue(os.path.exists(path))
+        post.delete()
+        self.assertEqual(MediaFile.objects.get().refs, 0)
+        call_command('collect_media', *options, stdout=out)
+        self.assertTrue(os.path.exists(path))
+        MediaFile.objects.update(
+            updated=timezone.now() - timedelta(hours=2)
+        )
+        call_command('collect_media', *options, stdout=out)
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(MediaFile.objects.exists())
+
+    def test_limited_run_resumes_from_checkpoint(self):
+        names = [
+            self.post_with_image(color).image.name
+            for color in ('red', 'green', 'blue')
+        ]
+        Post.objects.all().delete()
+        report = self.collect('--limit=2', '--batch-size=1')
+        self.assertIn('следующий прогон продолжит этап originals', report)
+        self.assertTrue(os.path.exists(self.checkpoint))
+        removed = [
+            name for name in sorted(names)
+            if not os.path.exists(os.path.join(self.media_root, name))
+        ]
+        self.assertEqual(removed, sorted(names)[:2])
+        self.collect()
+        for name in names:
+            self.assertFalse(
+                os.path.exists(os.path.join(self.media_root, name))
+            )
+        self.assertFalse(os.path.exists(self.checkpoint))
@@ -1,19 +1,33 @@
+import asyncio
 import shutil
 import tempfile
+import threading
 from datetime import datetime, timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
 from django.core.cache import cache
 from django import forms
-from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
 
-from ..models import Comment, Group, Post, Follow
+from core.common.paginator import CachedCountPaginator
+from .. import events, feeds, page_cache, thumbnails, views
+from ..models import (
+    Comment, Group, Post, Follow, ThumbnailUsage, TimelineEntry
+)
 
 User = get_user_model()
-TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
 
 
 class PostViewsTests(TestCase):
@@ -50,6 +64,7 @@ class PostViewsTests(TestCase):
             cls.post.save()
 
     def setUp(self):
+        cache.clear()
         self.authorized_client_author = Client()
         self.authorized_client_author.force_login(PostViewsTests.user)
 
@@ -233,6 +248,131 @@ class PostPaginatorTests(TestCase):
         )
         self.assertEqual(len(response.context['page_obj']), 5)
 
+    def test_cursor_pages_are_stable(self):
+        """Курсор ведёт на следующую страницу и не сдвигается,
+        если во время прокрутки появился новый пост."""
+        url = reverse('post:group_list', kwargs={'slug': 'first'})
+        response = self.authorized_client_author.get(url)
+        first_page = response.context['page_obj']
+        next_cursor = first_page.paginator.next_cursor
+        self.assertIsNotNone(next_cursor)
+        post = Post.objects.create(
+            author=PostPaginatorTests.user,
+            text='Новый пост',
+            group=PostPaginatorTests.group1
+        )
+        post.pub_date = datetime.now() + timedelta(days=1)
+        post.save()
+        response = self.authorized_client_author.get(
+            url, {'cursor': next_cursor}
+        )
+        second_page = response.context['page_obj']
+        self.assertEqual(second_page.number, 2)
+        self.assertFalse(second_page.has_next())
+        self.assertEqual(
+            [post.text for post in second_page],
+            [f'Тестовый пост {i}' for i in range(2, -1, -1)]
+        )
+        response = self.authorized_client_author.get(
+            url, {'cursor': second_page.paginator.previous_cursor}
+        )
+        self.assertEqual(
+            [post.text for post in response.context['page_obj']],
+            [post.text for post in first_page]
+        )
+
+    def test_broken_cursor_returns_first_page(self):
+        response = self.authorized_client_author.get(reverse(
+            'post:group_list', kwargs={'slug': 'first'}), {'cursor': 'xxx'}
+        )
+        self.assertEqual(response.context['page_obj'].number, 1)
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+
+@override_settings(POSTS_PAGINATION='elided')
+class ElidedPaginatorTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Первая группа',
+            slug='first',
+            description='Тестовое описание первой группы',
+        )
+        Post.objects.bulk_create(
+            Post(author=cls.user, text=f'Тестовый пост {i}', group=cls.group)
+            for i in range(13)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(ElidedPaginatorTests.reader)
+
+    def test_elided_page_range(self):
+        paginator = CachedCountPaginator(list(range(1000)), 10)
+        paginator.get_page(50)
+        self.assertEqual(
+            paginator.elided_page_range,
+            [1, '…', 48, 49, 50, 51, 52, '…', 100]
+        )
+
+    def test_count_is_cached_until_post_created(self):
+        url = reverse('post:group_list', kwargs={'slug': 'first'})
+        key = feeds.count_key(
+            feeds.group_scope(ElidedPaginatorTests.group.pk)
+        )
+        response = self.client.get(url, {'page': 2})
+        self.assertEqual(len(response.context['page_obj']), 3)
+        self.assertEqual(cache.get(key), 13)
+        Post.objects.create(
+            author=ElidedPaginatorTests.user,
+            text='Новый пост',
+            group=ElidedPaginatorTests.group
+        )
+        self.assertIsNone(cache.get(key))
+        response = self.client.get(url)
+        self.assertEqual(response.context['page_obj'].paginator.count, 14)
+
+    def follow_count(self):
+        response = self.client.get(reverse('post:follow_index'))
+        return response.context['page_obj'].paginator.count
+
+    def test_follow_count_changes_with_follows_and_posts(self):
+        """Число постов ленты подписок не устаревает, хотя пост автора
+        не трогает ключи его подписчиков."""
+        self.assertEqual(self.follow_count(), 0)
+        self.client.get(reverse(
+            'post:profile_follow',
+            kwargs={'username': ElidedPaginatorTests.user.username}
+        ))
+        self.assertEqual(self.follow_count(), 13)
+        post = Post.objects.create(
+            author=ElidedPaginatorTests.user, text='Новый пост'
+        )
+        self.assertEqual(self.follow_count(), 14)
+        post.delete()
+        self.assertEqual(self.follow_count(), 13)
+
+    def test_post_does_not_touch_follower_keys(self):
+        """Пост автора пишет в кеш независимо от числа подписчиков."""
+        for i in range(5):
+            Follow.objects.create(
+                user=User.objects.create_user(username=f'reader{i}'),
+                author=ElidedPaginatorTests.user,
+            )
+        with mock.patch.object(
+            cache, 'delete_many', wraps=cache.delete_many
+        ) as delete_many:
+            Post.objects.create(
+                author=ElidedPaginatorTests.user, text='Новый пост'
+            )
+        deleted = [key for call in delete_many.call_args_list
+                   for key in call.args[0]]
+        self.assertFalse([key for key in deleted if 'follow:' in key])
+
 
 class ImagePostViewsTests(TestCase):
     @classmethod
@@ -310,6 +450,142 @@ class ImagePostViewsTests(TestCase):
         self.assertEqual(post_image, post_result.image)
 
 
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ThumbnailPipelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        thumbnails._accessed.clear()
+        self.url = reverse('post:profile', kwargs={'username': 'auth'})
+
+    def create_post(self, name='picture.gif', color='red'):
+        image = Image.new('RGB', (1200, 800), color)
+        content = BytesIO()
+        image.save(content, 'GIF')
+        return Post.objects.create(
+            author=ThumbnailPipelineTests.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(name, content.getvalue()),
+        )
+
+    def test_placeholder_until_thumbnail_is_ready(self):
+        """Запрос не строит миниатюру, а показывает заглушку."""
+        post = self.create_post()
+        with mock.patch('posts.thumbnails.backend.build_many') as build:
+            response = self.client.get(self.url)
+        build.assert_not_called()
+        self.assertContains(response, 'aspect-ratio: 960 / 339')
+        self.assertNotContains(response, '<img class="card-img')
+        thumbnails.generate(post.image.name)
+        response = self.client.get(self.url)
+        self.assertContains(response, '<img class="card-img')
+
+    def test_new_image_is_scheduled(self):
+        """Миниатюры ставятся в очередь только при смене картинки."""
+        with mock.patch('posts.thumbnails.schedule') as schedule:
+            post = self.create_post()
+            self.assertEqual(schedule.call_count, 1)
+            post.text = 'Без новой картинки'
+            post.save()
+            self.assertEqual(schedule.call_count, 1)
+            post.image = SimpleUploadedFile('other.gif', b'GIF89a')
+            post.save()
+            self.assertEqual(schedule.call_count, 2)
+
+    def test_page_thumbnails_are_fetched_in_one_query(self):
+        """Миниатюры страницы ищутся одним запросом, а не по посту."""
+        for i in range(3):
+            post = self.create_post(f'picture{i}.gif')
+            thumbnails.generate(post.image.name)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries, mock.patch(
+            'posts.thumbnails.default.kvstore.get'
+        ) as single_get:
+            response = self.client.get(self.url)
+        single_get.assert_not_called()
+        kvstore_queries = [
+            query for query in queries
+            if 'thumbnail_kvstore' in query['sql']
+        ]
+        self.assertEqual(len(kvstore_queries), 1)
+        self.assertContains(response, '<img class="card-img', count=3)
+
+    def test_responsive_markup(self):
+        """Карточка отдаёт srcset всех ширин и размеры картинки."""
+        post = self.create_post()
+        thumbnails.generate(post.image.name)
+        response = self.client.get(self.url)
+        srcset = response.context['page_obj'][0]._prefetched_thumbnails[
+            post.image.name, 'card'
+        ].srcset
+        for width in (480, 960, 1440):
+            with self.subTest(width=width):
+                self.assertIn(f' {width}w', srcset)
+        self.assertContains(response, 'width="960" height="339"')
+        self.assertContains(response, 'loading="lazy"')
+
+    def test_placeholder_is_inlined(self):
+        """Размытая заглушка встроена в страницу и до миниатюры,
+        и под ней; у постов без неё она заполняется при построении."""
+        post = self.create_post()
+        Post.objects.filter(pk=post.pk).update(
+            image_placeholder='data:image/png;base64,AAAA'
+        )
+        response = self.client.get(self.url)
+        self.assertContains(
+            response, 'no-repeat url(data:image/png;base64,AAAA)'
+        )
+        Post.objects.filter(pk=post.pk).update(image_placeholder='')
+        thumbnails.generate(post.image.name)
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (1200, 800))
+        response = self.client.get(self.url)
+        self.assertContains(
+            response, f'no-repeat url({post.image_placeholder})'
+        )
+        self.assertContains(response, 'decoding="async"')
+
+    def test_least_recently_shown_thumbnails_are_evicted(self):
+        """Сверх бюджета удаляются миниатюры, которые дольше всех не
+        показывали; пост снова ждёт их с заглушкой."""
+        posts = []
+        for color in ('red', 'green', 'blue'):
+            post = self.create_post(f'{color}.gif', color)
+            thumbnails.generate(post.image.name)
+            posts.append(post)
+        shown, cold, warm = posts
+        ThumbnailUsage.objects.update(
+            accessed=timezone.now() - timedelta(hours=1)
+        )
+        ThumbnailUsage.objects.filter(name=warm.image.name).update(
+            accessed=timezone.now()
+        )
+        thumbnails.record_access([shown.image.name])
+        total = ThumbnailUsage.objects.aggregate(total=Sum('size'))['total']
+        with self.settings(THUMBNAIL_CACHE_MAX_BYTES=int(total * 0.8)):
+            self.assertEqual(thumbnails.evict(), 1)
+        self.assertFalse(
+            ThumbnailUsage.objects.filter(name=cold.image.name).exists()
+        )
+        for file in thumbnails.variant_files(cold.image, 'card').values():
+            self.assertFalse(file.exists())
+        self.assertIsNone(thumbnails.lookup(cold.image, 'card'))
+        self.assertIsNotNone(thumbnails.lookup(shown.image, 'card'))
+        stats = thumbnails.cache_stats()
+        self.assertEqual(stats['evicted'], 1)
+        self.assertEqual((stats['hit'], stats['miss']), (1, 1))
+        self.assertEqual(stats['images'], 2)
+
+
 class CommentPostTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -353,13 +629,14 @@ class CachePostTests(TestCase):
         )
 
     def setUp(self):
+        cache.clear()
         self.authorized_client_author = Client()
         self.authorized_client_author.force_login(CachePostTests.user)
 
     def test_cache_index(self):
         response = self.authorized_client_author.get(reverse('post:index'))
         post1 = response.content
-        Post.objects.all().delete()
+        Post.objects.update(text='Изменён в обход сигналов')
         response = self.authorized_client_author.get(reverse('post:index'))
         post2 = response.content
         self.assertIn(post1, post2)
@@ -368,6 +645,253 @@ class CachePostTests(TestCase):
         post3 = response.content
         self.assertNotIn(post2, post3)
 
+    def test_write_refreshes_cached_feeds(self):
+        """Запись в ленту сразу видна на закешированных страницах."""
+        group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        urls = (
+            reverse('post:index'),
+            reverse('post:group_list', kwargs={'slug': 'group'}),
+            reverse('post:profile', kwargs={'username': 'auth'}),
+        )
+        for url in urls:
+            self.authorized_client_author.get(url)
+        post = Post.objects.create(
+            author=CachePostTests.user, text='Свежий пост', group=group
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client_author.get(url)
+                self.assertContains(response, 'Свежий пост')
+        post.delete()
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client_author.get(url)
+                self.assertNotContains(response, 'Свежий пост')
+
+    def test_unrelated_write_keeps_cache(self):
+        """Пост в другой группе не сбрасывает страницу группы."""
+        Group.objects.create(title='Первая', slug='first', description='-')
+        other = Group.objects.create(
+            title='Вторая', slug='second', description='-'
+        )
+        url = reverse('post:group_list', kwargs={'slug': 'first'})
+        self.authorized_client_author.get(url)
+        Post.objects.create(
+            author=CachePostTests.user, text='Другое', group=other
+        )
+        response = self.authorized_client_author.get(url)
+        self.assertIsNone(response.context)
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='-'
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, text='Пост', group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(ConditionalGetTests.user)
+
+    def revalidate(self, url):
+        first = self.client.get(url)
+        return first, self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+
+    def test_unchanged_pages_are_not_rendered(self):
+        post = ConditionalGetTests.post
+        Follow.objects.create(
+            user=ConditionalGetTests.user,
+            author=User.objects.create_user(username='other'),
+        )
+        urls = (
+            reverse('post:index'),
+            reverse('post:group_list', kwargs={'slug': 'group'}),
+            reverse('post:profile', kwargs={'username': 'auth'}),
+            reverse('post:follow_index'),
+            reverse('post:post_detail', kwargs={'post_id': post.pk}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                first, second = self.revalidate(url)
+                self.assertEqual(first.status_code, 200)
+                self.assertIn('no-cache', first['Cache-Control'])
+                self.assertEqual(second.status_code, 304)
+                self.assertIsNone(second.context)
+                self.assertEqual(second.content, b'')
+
+    def test_changes_make_new_version(self):
+        """Новый пост, правка и комментарий меняют ETag страницы."""
+        post = ConditionalGetTests.post
+        index = reverse('post:index')
+        detail = reverse('post:post_detail', kwargs={'post_id': post.pk})
+        etags = {url: self.client.get(url)['ETag'] for url in (index, detail)}
+        Post.objects.create(author=ConditionalGetTests.user, text='Свежий')
+        response = self.client.get(index, HTTP_IF_NONE_MATCH=etags[index])
+        self.assertContains(response, 'Свежий')
+        Comment.objects.create(
+            post=post, author=ConditionalGetTests.user, text='Ответ'
+        )
+        response = self.client.get(detail, HTTP_IF_NONE_MATCH=etags[detail])
+        self.assertContains(response, 'Ответ')
+
+    def test_follow_feed_changes_make_new_version(self):
+        """ETag ленты подписок меняют пост, правка и отписка."""
+        author = User.objects.create_user(username='author')
+        follow = Follow.objects.create(
+            user=ConditionalGetTests.user, author=author
+        )
+        url = reverse('post:follow_index')
+        post = Post.objects.create(author=author, text='Первый')
+        etags = [self.client.get(url)['ETag']]
+        post.text = 'Исправленный'
+        post.save()
+        etags.append(self.client.get(url)['ETag'])
+        Post.objects.create(author=author, text='Второй')
+        etags.append(self.client.get(url)['ETag'])
+        follow.delete()
+        etags.append(self.client.get(url)['ETag'])
+        self.assertEqual(len(set(etags)), 4)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etags[-1]).status_code,
+            304,
+        )
+
+    def test_other_user_gets_own_page(self):
+        url = reverse('post:index')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(
+            Client().get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200
+        )
+
+    def test_if_modified_since(self):
+        url = reverse('post:profile', kwargs={'username': 'auth'})
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+
+class FeedPageCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        Post.objects.create(author=cls.user, text='Старый пост')
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('post:index')
+        self.key = page_cache.page_key(
+            feeds.INDEX, mock.Mock(
+                user=mock.Mock(is_authenticated=False),
+                get_full_path=lambda: self.url,
+            )
+        )
+
+    def test_counters(self):
+        """Первый запрос — промах, повторный — попадание."""
+        self.client.get(self.url)
+        self.client.get(self.url)
+        self.assertEqual(
+            page_cache.cache_stats(), {'hit': 1, 'miss': 1, 'stale': 0}
+        )
+
+    def test_stale_copy_while_other_request_rebuilds(self):
+        """Пока страницу пересобирает другой запрос, отдаётся старая."""
+        self.client.get(self.url)
+        Post.objects.create(author=FeedPageCacheTests.user, text='Новый')
+        cache.add(f'{self.key}:lock', 1)
+        response = self.client.get(self.url)
+        self.assertNotContains(response, 'Новый')
+        self.assertEqual(page_cache.cache_stats()['stale'], 1)
+        cache.delete(f'{self.key}:lock')
+        self.assertContains(self.client.get(self.url), 'Новый')
+
+    @override_settings(FEED_PAGE_LOCK_TIMEOUT=2)
+    def test_waits_for_rebuild_without_stale_copy(self):
+        """Без старой копии запрос ждёт пересборку, а не строит сам."""
+        cache.add(f'{self.key}:lock', 1)
+        generation = feeds.generations([feeds.EVERYTHING, feeds.INDEX])
+        rebuild = threading.Timer(0.2, page_cache.store, args=(
+            self.key, generation, HttpResponse('Собрано другим запросом')
+        ))
+        rebuild.start()
+        response = self.client.get(self.url)
+        rebuild.join()
+        self.assertContains(response, 'Собрано другим запросом')
+        self.assertEqual(page_cache.cache_stats()['miss'], 0)
+
+
+class GroupLookupTests(TestCase):
+    def test_group_rename_reaches_process_cache(self):
+        """Правка группы сбрасывает её копию в памяти процесса."""
+        group = Group.objects.create(
+            title='Старое название', slug='group', description='-'
+        )
+        url = reverse('post:group_list', kwargs={'slug': 'group'})
+        self.assertContains(self.client.get(url), 'Старое название')
+        group.title = 'Новое название'
+        group.save()
+        self.assertContains(self.client.get(url), 'Новое название')
+
+
+class PostCardCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='auth', first_name='Лев', last_name='Толстой'
+        )
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, text='Исходный текст', group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(PostCardCacheTests.user)
+        self.group_url = reverse('post:group_list', kwargs={'slug': 'group'})
+        self.profile_url = reverse(
+            'post:profile', kwargs={'username': 'auth'}
+        )
+        self.client.get(self.group_url)
+
+    def test_card_is_shared_between_feeds(self):
+        """Карточка, отрисованная в одной ленте, берётся из кеша в другой."""
+        Post.objects.update(text='Текст в обход save()')
+        response = self.client.get(self.profile_url)
+        self.assertContains(response, 'Исходный текст')
+
+    def test_edit_invalidates_card(self):
+        """Правка поста сбрасывает его карточку."""
+        post = PostCardCacheTests.post
+        self.client.post(
+            reverse('post:post_edit', kwargs={'post_id': post.pk}),
+            data={'text': 'Новый текст', 'group': post.group_id},
+        )
+        response = self.client.get(self.group_url)
+        self.assertContains(response, 'Новый текст')
+        self.assertNotContains(response, 'Исходный текст')
+
+    def test_author_rename_invalidates_card(self):
+        """Смена имени автора сбрасывает его карточки."""
+        user = User.objects.get(pk=PostCardCacheTests.user.pk)
+        user.first_name = 'Алексей'
+        user.save()
+        response = self.client.get(self.group_url)
+        self.assertContains(response, 'Алексей Толстой')
+
 
 class FollowPostTests(TestCase):
     @classmethod
@@ -437,3 +961,262 @@ class FollowPostTests(TestCase):
             )
         )
         self.assertEqual(Follow.objects.count(), follow_cnt)
+
+
+class FollowEventsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.stranger = User.objects.create_user(username='stranger')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.old = Post.objects.create(author=cls.author, text='Старый')
+
+    def test_snapshot_without_asgi(self):
+        """Без ASGI ответ сообщает текущее число новых постов и просит
+        переподключиться."""
+        Post.objects.create(author=FollowEventsTests.author, text='Новый')
+        client = Client()
+        client.force_login(FollowEventsTests.reader)
+        response = client.get(
+            reverse('post:follow_events'),
+            {'after': FollowEventsTests.old.pk},
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn('retry: ', body)
+        self.assertIn(f'id: {FollowEventsTests.old.pk}', body)
+        self.assertIn('data: {"count": 1}', body)
+
+    def test_only_first_page_listens(self):
+        """Посты с первой страницы не считаются новыми на второй."""
+        for i in range(10):
+            Post.objects.create(author=FollowEventsTests.author, text=f'{i}')
+        client = Client()
+        client.force_login(FollowEventsTests.reader)
+        url = reverse('post:follow_index')
+        first = client.get(url)
+        self.assertContains(first, reverse('post:follow_events'))
+        second = client.get(
+            url, {'cursor': first.context['page_obj'].paginator.next_cursor}
+        )
+        self.assertEqual(len(second.context['page_obj']), 1)
+        self.assertIsNone(second.context['latest'])
+        self.assertNotContains(second, reverse('post:follow_events'))
+
+    @override_settings(FOLLOW_EVENTS_POLL_INTERVAL=0.01)
+    def test_stream_wakes_on_followed_author_post(self):
+        stream = events.EventStream(
+            FollowEventsTests.reader.pk, FollowEventsTests.old.pk
+        )
+        sent = []
+
+        async def send(chunk):
+            sent.append(chunk.decode())
+
+        async def run_sync(func, *args):
+            return func(*args)
+
+        async def scenario():
+            task = asyncio.ensure_future(stream.asgi_stream(send, run_sync))
+            await asyncio.sleep(0.05)
+            Post.objects.create(author=FollowEventsTests.stranger, text='-')
+            await asyncio.sleep(0.05)
+            self.assertEqual(len(sent), 1)
+            Post.objects.create(author=FollowEventsTests.author, text='-')
+            await asyncio.sleep(0.05)
+            task.cancel()
+
+        asyncio.run(scenario())
+        self.assertIn('"count": 0', sent[0])
+        self.assertIn('"count": 1', sent[1])
+        self.assertEqual(len(sent), 2)
+
+
+@override_settings(FEED_CELEBRITY_THRESHOLD=2)
+class HybridFeedTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.fan = User.objects.create_user(username='fan')
+        cls.author = User.objects.create_user(username='author')
+        cls.star = User.objects.create_user(username='star')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        Follow.objects.create(user=cls.reader, author=cls.star)
+        Follow.objects.create(user=cls.fan, author=cls.star)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(HybridFeedTests.reader)
+
+    def test_celebrity_posts_are_merged_on_read(self):
+        """Посты знаменитости не раздаются, но попадают в ленту
+        вперемешку с остальными по дате."""
+        texts = []
+        for i in range(12):
+            author = HybridFeedTests.star if i % 3 else HybridFeedTests.author
+            Post.objects.create(author=author, text=f'Пост {i}')
+            texts.insert(0, f'Пост {i}')
+        self.assertFalse(
+            TimelineEntry.objects.filter(
+                post__author=HybridFeedTests.star
+            ).exists()
+        )
+        response = self.client.get(reverse('post:follow_index'))
+        page_obj = response.context['page_obj']
+        self.assertEqual([post.text for post in page_obj], texts[:10])
+        response = self.client.get(
+            reverse('post:follow_index'),
+            {'cursor': page_obj.paginator.next_cursor}
+        )
+        self.assertEqual(
+            [post.text for post in response.context['page_obj']], texts[10:]
+        )
+
+    def feed_texts(self):
+        response = self.client.get(reverse('post:follow_index'))
+        return [post.text for post in response.context['page_obj']]
+
+    def test_author_dropping_below_threshold_is_fanned_out(self):
+        """Когда знаменитость теряет подписчиков, её посты раскладываются
+        по лентам оставшихся."""
+        Post.objects.create(author=HybridFeedTests.star, text='Пост звезды')
+        Follow.objects.filter(user=HybridFeedTests.fan).delete()
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=HybridFeedTests.reader, post__text='Пост звезды'
+            ).exists()
+        )
+        self.assertEqual(self.feed_texts(), ['Пост звезды'])
+
+    def test_author_reaching_threshold_is_merged_on_read(self):
+        """Новый знаменитый автор убирается из разложенных лент, а его
+        старые и новые посты показываются по одному разу."""
+        Post.objects.create(author=HybridFeedTests.author, text='Старый')
+        Follow.objects.create(
+            user=HybridFeedTests.fan, author=HybridFeedTests.author
+        )
+        Post.objects.create(author=HybridFeedTests.author, text='Новый')
+        self.assertFalse(
+            TimelineEntry.objects.filter(
+                post__author=HybridFeedTests.author
+            ).exists()
+        )
+        self.assertEqual(self.feed_texts(), ['Новый', 'Старый'])
+
+
+class FeedQueriesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа',
+            slug='group',
+            description='Описание',
+        )
+        for i in range(12):
+            author = User.objects.create_user(
+                username=f'author{i}', first_name='Имя', last_name=str(i)
+            )
+            Follow.objects.create(user=cls.reader, author=author)
+            Post.objects.create(
+                author=author, text=f'Пост {i}', group=cls.group
+            )
+        cls.author = author
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(FeedQueriesTests.reader)
+
+    def count_queries(self, url, per_page):
+        cache.clear()
+        views.groups.clear()
+        with mock.patch('core.common.utils.POSTS_PER_PAGE', per_page):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+        self.assertEqual(len(response.context['page_obj']), per_page)
+        return len(queries)
+
+    def test_feeds_render_in_constant_queries(self):
+        """Число запросов ленты не зависит от размера страницы."""
+        urls = {
+            'index': reverse('post:index'),
+            'group_list': reverse(
+                'post:group_list', kwargs={'slug': 'group'}
+            ),
+            'follow_index': reverse('post:follow_index'),
+        }
+        for name, url in urls.items():
+            with self.subTest(name=name):
+                self.assertEqual(
+                    self.count_queries(url, 2), self.count_queries(url, 10)
+                )
+        url = reverse(
+            'post:profile',
+            kwargs={'username': FeedQueriesTests.author.username}
+        )
+        Post.objects.bulk_create(
+            Post(author=FeedQueriesTests.author, text=f'Ещё пост {i}')
+            for i in range(10)
+        )
+        self.assertEqual(
+            self.count_queries(url, 2), self.count_queries(url, 10)
+        )
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.weak = Post.objects.create(
+            author=cls.user,
+            text='Заметки о путешествиях, среди прочего про котов',
+        )
+        cls.strong = Post.objects.create(
+            author=cls.user, text='Коты, коты и ещё раз коты'
+        )
+        Post.objects.create(author=cls.user, text='Про собак')
+
+    def search(self, query):
+        response = self.client.get(reverse('post:search'), {'q': query})
+        return list(response.context['page_obj'])
+
+    def test_results_are_ranked_and_highlighted(self):
+        """Более релевантный пост выше, найденное слово подсвечено."""
+        results = self.search('коты')
+        self.assertEqual(results, [SearchTests.strong])
+        self.assertIn('<mark>Коты</mark>', results[0].snippet)
+        self.assertEqual(
+            self.search('кот'), [SearchTests.strong, SearchTests.weak]
+        )
+
+    def test_query_syntax_is_not_interpreted(self):
+        """Операторы FTS5 во вводе не ломают поиск."""
+        for query in ('"коты', 'коты OR', 'NEAR(', '*', '<b>'):
+            with self.subTest(query=query):
+                response = self.client.get(
+                    reverse('post:search'), {'q': query}
+                )
+                self.assertEqual(response.status_code, 200)
+
+    def test_index_follows_edits_and_deletes(self):
+        """Индекс обновляется при правке и удалении поста."""
+        post = Post.objects.get(pk=SearchTests.weak.pk)
+        post.text = 'Теперь только про собак'
+        post.save()
+        self.assertEqual(self.search('кот'), [SearchTests.strong])
+        self.assertEqual(len(self.search('собак')), 2)
+        Post.objects.filter(pk=SearchTests.strong.pk).delete()
+        self.assertEqual(self.search('коты'), [])
+
+    def test_rebuild_restores_index(self):
+        """Команда пересборки возвращает в индекс все посты."""
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM posts_search')
+        self.assertEqual(self.search('коты'), [])
+        call_command('rebuild_search_index', batch_size=2, stdout=StringIO())
+        self.assertEqual(self.search('коты'), [SearchTests.strong])
@@ -0,0 +1,457 @@
+"""Миниатюры картинок постов, которые готовятся вне запроса.
+
+При сохранении поста с новой картинкой все размеры из SIZES строятся в
+пуле процессов. Шаблоны берут только готовые миниатюры (см. тег
+post_thumbnail) и, пока миниатюры нет, показывают заглушку. Когда
+миниатюры готовы, у поста обновляется updated, и карточки и страницы
+лент пересобираются уже с картинкой.
+
+Место под миниатюры ограничено THUMBNAIL_CACHE_MAX_BYTES: когда оно
+кончается, удаляются миниатюры картинок, которые дольше всех не
+показывали, и при следующем показе строятся заново.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from math import ceil
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import Count, Min, Sum
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.conf import defaults as thumbnail_defaults
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.parsers import parse_geometry
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core.common.counters import Counters
+from core.common.workers import process_pool
+
+from . import feeds, uploads
+from .models import Post, ThumbnailUsage
+
+logger = logging.getLogger(__name__)
+
+counters = Counters('thumbnail_stats', ('hit', 'miss', 'evicted'))
+# Вытеснение освобождает место с запасом, до этой доли бюджета.
+EVICT_TO = 0.9
+EVICT_BATCH = 100
+
+# Миниатюры только в JPEG: Pillow из requirements.txt собран без WebP,
+# а файлы AVIF sorl-thumbnail называть не умеет.
+FORMAT = 'JPEG'
+
+
+class Size:
+    """Размер картинки в шаблоне.
+
+    Строится в нескольких ширинах с одним соотношением сторон; sizes —
+    атрибут для srcset.
+    """
+
+    def __init__(self, width, height, widths, sizes, **options):
+        self.width = width
+        self.height = height
+        self.widths = widths
+        self.sizes = sizes
+        self.options = options
+
+    def geometry(self, width):
+        return f'{width}x{round(width * self.height / self.width)}'
+
+    def variants(self):
+        for width in self.widths:
+            yield width, FORMAT
+
+
+# Размеры, в которых картинки постов показываются в шаблонах.
+SIZES = {
+    'card': Size(
+        960, 339, widths=(480, 960, 1440),
+        sizes='(min-width: 992px) 960px, 100vw',
+        crop='center', upscale=True,
+    ),
+}
+
+
+class Picture:
+    """Готовые варианты картинки для <img srcset>."""
+
+    def __init__(self, size, files):
+        base = files[size.width, FORMAT]
+        self.src = base.url
+        self.width = base.width
+        self.height = base.height
+        self.sizes = size.sizes
+        self.srcset = ', '.join(
+            f'{file.url} {width}w'
+            for (width, _), file in sorted(files.items())
+        )
+
+
+_lock = threading.Lock()
+_pool = {}
+_pending = set()
+
+
+class VariantBackend(ThumbnailBackend):
+    def _full_options(self, source, options):
+        """Параметры, дополненные так же, как в get_thumbnail, чтобы имя
+        миниатюры совпало с построенной."""
+        options = dict(options)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(thumbnail_defaults, attr):
+                options.setdefault(key, value)
+        return options
+
+    def thumbnail_file(self, file_, geometry_string, **options):
+        """Файл миниатюры, как его назовёт get_thumbnail; без построения."""
+        source = ImageFile(file_)
+        options = self._full_options(source, options)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def build_many(self, file_, variants):
+        """Построить миниатюры (геометрия, параметры), декодировав
+        оригинал один раз, а не на каждую, как get_thumbnail."""
+        source = ImageFile(file_)
+        source_image = image_info = None
+        try:
+            for geometry_string, options in variants:
+                options = self._full_options(source, options)
+                name = self._get_thumbnail_filename(
+                    source, geometry_string, options
+                )
+                thumbnail = ImageFile(name, default.storage)
+                if default.kvstore.get(thumbnail):
+                    continue
+                if not thumbnail.exists():
+                    if source_image is None:
+                        source_image = default.engine.get_image(source)
+                        image_info = default.engine.get_image_info(
+                            source_image
+                        )
+                        source.set_size(
+                            default.engine.get_image_size(source_image)
+                        )
+                        self._draft(source_image, variants)
+                    options['image_info'] = image_info
+                    self._create_thumbnail(
+                        source_image, geometry_string, options, thumbnail
+                    )
+                    self._create_alternative_resolutions(
+                        source_image, geometry_string, options,
+                        thumbnail.name
+                    )
+                default.kvstore.get_or_set(source)
+                default.kvstore.set(thumbnail, source)
+        finally:
+            if source_image is not None:
+                default.engine.cleanup(source_image)
+
+    @staticmethod
+    def _draft(image, variants):
+        """Декодировать JPEG сразу уменьшенным, но не меньше, чем нужно
+        самому большому варианту: ресайз полного кадра дороже всего."""
+        width, height = image.size
+        factor = 0
+        for geometry_string, options in variants:
+            x, y = parse_geometry(geometry_string, width / height)
+            scales = (x / width, y / height)
+            factor = max(
+                factor, max(scales) if options.get('crop') else min(scales)
+            )
+        if 0 < factor < 1:
+            image.draft('RGB', (ceil(width * factor), ceil(height * factor)))
+
+
+backend = VariantBackend()
+
+
+def variant_files(image, size):
+    """Файлы всех вариантов картинки: {(ширина, формат): файл}."""
+    size = SIZES[size]
+    return {
+        (width, image_format): backend.thumbnail_file(
+            image, size.geometry(width), format=image_format, **size.options
+        )
+        for width, image_format in size.variants()
+    }
+
+
+def picture(size, found):
+    """Picture из готовых вариантов или None, пока нет основного."""
+    found = {key: file for key, file in found.items() if file}
+    if (SIZES[size].width, FORMAT) not in found:
+        return None
+    return Picture(SIZES[size], found)
+
+
+def lookup(image, size):
+    """Готовые варианты картинки (Picture) или None."""
+    prefetched = getattr(image.instance, '_prefetched_thumbnails', {})
+    if (image.name, size) in prefetched:
+        return prefetched[image.name, size]
+    files = variant_files(image, size)
+    found = picture(size, {
+        key: default.kvstore.get(file) for key, file in files.items()
+    })
+    if found is None:
+        counters.count(miss=1)
+    else:
+        counters.count(hit=1)
+        record_access([image.name])
+    return found
+
+
+def _get_many_raw(keys):
+    """Значения хранилища sorl по ключам: кеш одним get_many, остальное
+    одним запросом к базе. Промахи запоминаются в кеше, как в sorl."""
+    kvstore = default.kvstore
+    if not isinstance(kvstore, cached_db_kvstore.KVStore):
+        return {key: kvstore._get_raw(key) for key in keys}
+    empty = cached_db_kvstore.EMPTY_VALUE
+    found = kvstore.cache.get_many(keys)
+    missing = set(keys) - set(found)
+    if missing:
+        loaded = dict(
+            KVStoreModel.objects.filter(key__in=missing)
+            .values_list('key', 'value')
+        )
+        loaded.update((key, empty) for key in missing if key not in loaded)
+        kvstore.cache.set_many(
+            loaded, thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT
+        )
+        found.update(loaded)
+    return {
+        key: None if value == empty else value
+        for key, value in found.items()
+    }
+
+
+def prefetch(posts, sizes=None):
+    """Найти готовые миниатюры всех постов страницы за одно обращение.
+
+    Результат запоминается на постах, и тег post_thumbnail берёт его
+    оттуда, не обращаясь к хранилищу sorl за каждой картинкой.
+    """
+    sizes = sizes or list(SIZES)
+    keys = {}
+    for post in posts:
+        if post.image:
+            for size in sizes:
+                files = variant_files(post.image, size)
+                keys[post.image.name, size] = {
+                    variant: add_prefix(file.key)
+                    for variant, file in files.items()
+                }
+    values = _get_many_raw(list({
+        key for variants in keys.values() for key in variants.values()
+    }))
+    found = {
+        (name, size): picture(size, {
+            variant: (
+                deserialize_image_file(values[key])
+                if values.get(key) else None
+            )
+            for variant, key in variants.items()
+        })
+        for (name, size), variants in keys.items()
+    }
+    for post in posts:
+        if post.image:
+            post._prefetched_thumbnails = {
+                key: value for key, value in found.items()
+                if key[0] == post.image.name
+            }
+    hits = {name for (name, size), value in found.items() if value}
+    counters.count(
+        hit=len(hits), miss=len({name for name, size in found} - hits)
+    )
+    record_access(hits)
+
+
+def access_key(name):
+    return f'thumbnail_access:{hashlib.md5(name.encode()).hexdigest()}'
+
+
+_accessed = {}
+
+
+def record_access(names):
+    """Запомнить время показа миниатюр в общем кеше.
+
+    Каждый процесс пишет время картинки не чаще раза в
+    THUMBNAIL_ACCESS_RESOLUTION секунд; в базу оно попадает только при
+    вытеснении, поэтому показ не стоит запроса к ней.
+    """
+    now = time.time()
+    resolution = settings.THUMBNAIL_ACCESS_RESOLUTION
+    stale = [
+        name for name in names if now - _accessed.get(name, 0) >= resolution
+    ]
+    if not stale:
+        return
+    if len(_accessed) > 10000:
+        _accessed.clear()
+    _accessed.update((name, now) for name in stale)
+    cache.set_many({access_key(name): now for name in stale}, None)
+
+
+def source_file(name):
+    # Хранилище поля, а не стандартное: от него зависят ключи sorl.
+    return ImageFile(name, Post._meta.get_field('image').storage)
+
+
+def refresh_posts(name):
+    """Пересобрать карточки и страницы лент с постами этой картинки."""
+    posts = Post.objects.filter(image=name).select_related('author')
+    for post in posts:
+        Post.objects.filter(pk=post.pk).update(updated=timezone.now())
+        feeds.bump(feeds.post_pages(post))
+
+
+def generate(name):
+    """Построить все размеры картинки и обновить посты с ней."""
+    source = source_file(name)
+    backend.build_many(source, [
+        (size.geometry(width), {'format': image_format, **size.options})
+        for size in SIZES.values()
+        for width, image_format in size.variants()
+    ])
+    files = [
+        file for size in SIZES for file in variant_files(source, size).values()
+    ]
+    # Посты, загруженные в обход формы (и до заглушек), получают
+    # размеры и заглушку здесь.
+    missing = Post.objects.filter(image=name, image_placeholder='')
+    if missing.exists():
+        with source.storage.open(name) as file:
+            missing.update(**uploads.details(file))
+    ThumbnailUsage.objects.update_or_create(name=name, defaults={
+        'size': sum(
+            file.storage.size(file.name) for file in files if file.exists()
+        ),
+        'accessed': timezone.now(),
+    })
+    refresh_posts(name)
+    evict(keep=name)
+
+
+def evict(keep=None):
+    """Удалить давно не показанные миниатюры, если они не влезают в
+    THUMBNAIL_CACHE_MAX_BYTES. Возвращает число освобождённых картинок.
+
+    Время показа в базе отстаёт от записанного в кеше, поэтому перед
+    удалением оно сверяется и, если картинку показывали, обновляется.
+    """
+    budget = settings.THUMBNAIL_CACHE_MAX_BYTES
+    total = ThumbnailUsage.objects.aggregate(total=Sum('size'))['total'] or 0
+    if not budget or total <= budget:
+        return 0
+    evicted = 0
+    while total > budget * EVICT_TO:
+        rows = list(
+            ThumbnailUsage.objects.exclude(name=keep)
+            .order_by('accessed')[:EVICT_BATCH]
+        )
+        if not rows:
+            break
+        recorded = cache.get_many([access_key(row.name) for row in rows])
+        for row in rows:
+            seen = recorded.get(access_key(row.name))
+            # Секунда запаса: время в базе хранится с округлением.
+            if seen is not None and seen > row.accessed.timestamp() + 1:
+                ThumbnailUsage.objects.filter(pk=row.pk).update(
+                    accessed=datetime.fromtimestamp(seen, timezone.utc)
+                )
+                continue
+            default.kvstore.delete_thumbnails(source_file(row.name))
+            row.delete()
+            refresh_posts(row.name)
+            total -= row.size
+            evicted += 1
+            if total <= budget * EVICT_TO:
+                break
+    counters.count(evicted=evicted)
+    return evicted
+
+
+def cache_stats():
+    """Попадания и промахи миниатюр, вытеснения и занятое место."""
+    stats = counters.values()
+    stats.update(ThumbnailUsage.objects.aggregate(
+        images=Count('pk'), bytes=Sum('size'), oldest=Min('accessed'),
+    ))
+    stats['bytes'] = stats['bytes'] or 0
+    stats['budget'] = settings.THUMBNAIL_CACHE_MAX_BYTES
+    return stats
+
+
+def reset_stats():
+    counters.reset()
+
+
+def _run(name):
+    try:
+        generate(name)
+    finally:
+        close_old_connections()
+
+
+def _executor():
+    pid = os.getpid()
+    with _lock:
+        if _pool.get('pid') != pid:
+            _pool['pid'] = pid
+            _pool['executor'] = process_pool(settings.THUMBNAIL_WORKERS)
+            _pending.clear()
+        return _pool['executor']
+
+
+def _submit(name):
+    if not settings.THUMBNAIL_WORKERS:
+        # Как и в пуле, ошибка сборки не должна ронять сохранивший пост
+        # запрос: пост показывается с заглушкой.
+        try:
+            generate(name)
+        except Exception:
+            logger.exception('Не удалось построить миниатюры %s', name)
+        return
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    future = _executor().submit(_run, name)
+    future.add_done_callback(lambda future: _done(name, future))
+
+
+def _done(name, future):
+    with _lock:
+        _pending.discard(name)
+    if future.exception() is not None:
+        logger.error(
+            'Не удалось построить миниатюры %s', name,
+            exc_info=future.exception(),
+        )
+
+
+def schedule(image):
+    """Поставить картинку в очередь после коммита транзакции."""
+    if image:
+        name = image.name
+        transaction.on_commit(lambda: _submit(name))
@@ -0,0 +1,159 @@
+"""Лента подписок: гибрид раздачи при записи и сборки при чтении.
+
+Посты обычных авторов раскладываются подписчикам при публикации, при
+подписке лента дополняется постами автора, при отписке — очищается от
+них. Посты «знаменитостей» (не меньше FEED_CELEBRITY_THRESHOLD
+подписчиков) не раздаются, а подмешиваются в ленту при чтении. Автор,
+пересёкший порог, убирается из разложенных лент или раскладывается в
+них заново (followers_changed).
+"""
+from operator import attrgetter
+
+from django.conf import settings
+from django.db.models import Q
+
+from core.common.utils import paginate, paginate_merged
+
+from . import feeds
+from .models import (AuthorStats, Follow, Post, PostQuerySet,
+                     TimelineEntry)
+
+
+def is_celebrity(author_id):
+    return AuthorStats.objects.filter(
+        user_id=author_id,
+        followers_count__gte=settings.FEED_CELEBRITY_THRESHOLD,
+    ).exists()
+
+
+def followed_celebrities(user):
+    return list(
+        Follow.objects.filter(
+            user=user,
+            author__stats__followers_count__gte=(
+                settings.FEED_CELEBRITY_THRESHOLD
+            ),
+        ).values_list('author_id', flat=True)
+    )
+
+
+def fan_out(post):
+    if is_celebrity(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+            for user_id in followers
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def spread(user_ids, author_id):
+    """Разложить последние посты автора в ленты пользователей."""
+    posts = Post.objects.filter(author_id=author_id).values_list(
+        'pk', 'pub_date'
+    )[:settings.TIMELINE_BACKFILL_LIMIT]
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+            for pk, pub_date in posts
+            for user_id in user_ids
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id):
+    if not is_celebrity(author_id):
+        spread([user_id], author_id)
+
+
+def trim(user_id, author_id):
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def followers_changed(author_id, delta):
+    """Перестроить ленты, если после сдвига числа подписчиков автора на
+    delta он пересёк порог знаменитости в ту или другую сторону."""
+    followers = AuthorStats.objects.filter(user_id=author_id).values_list(
+        'followers_count', flat=True
+    ).first()
+    if followers is None:
+        return
+    threshold = settings.FEED_CELEBRITY_THRESHOLD
+    if followers - delta < threshold <= followers:
+        # Теперь посты автора подмешиваются при чтении.
+        TimelineEntry.objects.filter(post__author_id=author_id).delete()
+    elif followers < threshold <= followers - delta:
+        spread(
+            list(
+                Follow.objects.filter(author_id=author_id)
+                .values_list('user_id', flat=True)
+            ),
+            author_id,
+        )
+    else:
+        return
+    # Разложенных постов может стать меньше: не больше
+    # TIMELINE_BACKFILL_LIMIT.
+    feeds.bump([feeds.author_scope(author_id)])
+
+
+def move(post):
+    """Перенести пост на новое место в лентах после смены даты."""
+    TimelineEntry.objects.filter(post=post).update(pub_date=post.pub_date)
+
+
+def feed_sources(user, celebrities):
+    """Материализованная лента и по источнику на каждую знаменитость."""
+    entries = TimelineEntry.objects.filter(user=user).select_related(
+        'post__author', 'post__group'
+    ).only(
+        'pub_date', 'post',
+        *(f'post__{field}' for field in PostQuerySet.FEED_FIELDS)
+    )
+    sources = [(entries, ('pub_date', 'post_id'), attrgetter('post'))]
+    sources += [
+        (
+            Post.objects.for_feed().filter(author_id=author_id),
+            ('pub_date', 'pk'),
+            None,
+        )
+        for author_id in celebrities
+    ]
+    return sources
+
+
+def followed_authors(user):
+    """Авторы подписок пользователя и знаменитости среди них."""
+    follows = Follow.objects.filter(user=user).values_list(
+        'author_id', 'author__stats__followers_count'
+    )
+    threshold = settings.FEED_CELEBRITY_THRESHOLD
+    return (
+        [author_id for author_id, _ in follows],
+        [
+            author_id for author_id, followers in follows
+            if (followers or 0) >= threshold
+        ],
+    )
+
+
+def paginate_feed(request, user):
+    """Страница ленты подписок пользователя."""
+    if settings.POSTS_PAGINATION == 'keyset':
+        celebrities = followed_celebrities(user)
+        return paginate_merged(request, feed_sources(user, celebrities))
+    authors, celebrities = followed_authors(user)
+    posts = Post.objects.for_feed().filter(
+        Q(timeline_entries__user=user) | Q(author_id__in=celebrities)
+    ).distinct()
+    return paginate(
+        request, posts, feeds.follow_count_key(user.pk, authors)
+    )
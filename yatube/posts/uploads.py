@@ -0,0 +1,187 @@
+"""Потоковая загрузка картинок постов.
+
+Обработчик пишет файл на диск частями и по пути считает sha256. По
+первым килобайтам он определяет формат и размер картинки, не декодируя
+её, и бракует слишком большие файлы и «бомбы» распаковки сразу, не
+дописывая их до конца. Нормализация (поворот по EXIF и ограничение
+стороны) делается одним декодированием и только когда она нужна.
+"""
+import base64
+import hashlib
+from functools import wraps
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import Image, ImageFilter, ImageOps
+
+# Сколько начала файла читать, пока в нём ищется заголовок картинки.
+PROBE_BYTES = 256 * 1024
+EXIF_ORIENTATION = 0x0112
+CHUNK_SIZE = 64 * 1024
+# Сторона картинки-заглушки, которая показывается до загрузки настоящей.
+PLACEHOLDER_SIDE = 16
+# Ориентации EXIF, при которых ширина и высота меняются местами.
+TRANSPOSED = {5, 6, 7, 8}
+# Расширение по формату: у одинаковых картинок должно совпадать и имя.
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp'}
+
+
+class ImageProbe:
+    """Формат, размер и поворот картинки, прочитанные из заголовка."""
+
+    def __init__(self, image):
+        self.format = image.format
+        self.width, self.height = image.size
+        # getexif() у PNG дочитывает файл целиком, поэтому EXIF берётся
+        # только из заголовка (у JPEG и WebP он там).
+        exif = Image.Exif()
+        if 'exif' in image.info:
+            exif.load(image.info['exif'])
+        self.orientation = exif.get(EXIF_ORIENTATION, 1)
+
+    @property
+    def content_type(self):
+        return Image.MIME.get(self.format)
+
+    @property
+    def extension(self):
+        return EXTENSIONS.get(self.format, '')
+
+
+def probe(head):
+    """(ImageProbe или None, ошибка или None) по началу файла.
+
+    Пустой результат без ошибки значит, что заголовок ещё не дочитан.
+    """
+    try:
+        with Image.open(BytesIO(head)) as image:
+            found = ImageProbe(image)
+    except Image.DecompressionBombError:
+        return None, 'Картинка слишком большая.'
+    except (OSError, SyntaxError, ValueError):
+        if len(head) < PROBE_BYTES:
+            return None, None
+        return None, 'Загрузите картинку.'
+    if found.format not in settings.POST_IMAGE_FORMATS:
+        return None, 'Формат картинки не поддерживается.'
+    if found.width * found.height > settings.POST_IMAGE_MAX_PIXELS:
+        return None, 'Картинка слишком большая.'
+    return found, None
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку во временный файл частями, не держа её в памяти.
+
+    У готового файла есть sha256, image_probe и upload_error; при ошибке
+    остаток файла дочитывается из запроса, но не записывается.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+        self.head = b''
+        self.received = 0
+        self.image_probe = None
+        self.error = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.error is not None:
+            return None
+        self.received += len(raw_data)
+        if self.received > settings.POST_IMAGE_MAX_BYTES:
+            self.error = 'Файл слишком большой.'
+            return None
+        if self.image_probe is None:
+            self.head += raw_data
+            self.image_probe, self.error = probe(self.head)
+            if self.image_probe is not None or self.error is not None:
+                self.head = b''
+        self.hasher.update(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.error is None and self.image_probe is None:
+            self.error = 'Загрузите картинку.'
+        uploaded = super().file_complete(file_size)
+        uploaded.sha256 = self.hasher.hexdigest()
+        uploaded.image_probe = self.image_probe
+        uploaded.upload_error = self.error
+        return uploaded
+
+
+def stream_images(view):
+    """Принимать файлы view через ImageUploadHandler.
+
+    Обработчики меняются до первого чтения request.POST, а CSRF-проверка
+    читает его, поэтому она переносится внутрь.
+    """
+    protected = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers = [ImageUploadHandler(request)]
+        return protected(request, *args, **kwargs)
+    return wrapper
+
+
+def normalize(uploaded):
+    """Повернуть картинку по EXIF и ужать до POST_IMAGE_MAX_SIDE.
+
+    Файл, которому это не нужно, и анимации возвращаются как есть;
+    иначе картинка декодируется один раз (JPEG — сразу уменьшенной) и
+    перезаписывается в том же временном файле.
+    """
+    found = uploaded.image_probe
+    max_side = settings.POST_IMAGE_MAX_SIDE
+    too_big = max(found.width, found.height) > max_side
+    if not too_big and found.orientation == 1:
+        return uploaded
+    uploaded.seek(0)
+    with Image.open(uploaded) as image:
+        if getattr(image, 'is_animated', False):
+            uploaded.seek(0)
+            return uploaded
+        image.draft(image.mode, (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_side, max_side))
+    uploaded.seek(0)
+    uploaded.truncate()
+    image.save(uploaded, found.format, quality=90)
+    uploaded.size = uploaded.tell()
+    uploaded.seek(0)
+    hasher = hashlib.sha256()
+    for chunk in uploaded.chunks(CHUNK_SIZE):
+        hasher.update(chunk)
+    uploaded.sha256 = hasher.hexdigest()
+    uploaded.seek(0)
+    return uploaded
+
+
+def details(file):
+    """Размеры картинки (с учётом поворота по EXIF) и заглушка к ней.
+
+    Заглушка — картинка в несколько пикселей, размытая и встроенная
+    в data: URI, чтобы страница рисовала её сразу, без запросов.
+    """
+    file.seek(0)
+    with Image.open(file) as image:
+        width, height = image.size
+        if image.getexif().get(EXIF_ORIENTATION, 1) in TRANSPOSED:
+            width, height = height, width
+        image.draft('RGB', (PLACEHOLDER_SIDE, PLACEHOLDER_SIDE))
+        small = ImageOps.exif_transpose(image).convert('RGB')
+    file.seek(0)
+    small.thumbnail((PLACEHOLDER_SIDE, PLACEHOLDER_SIDE))
+    small = small.filter(ImageFilter.GaussianBlur(1))
+    content = BytesIO()
+    small.save(content, 'PNG', optimize=True)
+    encoded = base64.b64encode(content.getvalue()).decode()
+    return {
+        'image_width': width,
+        'image_height': height,
+        'image_placeholder': f'data:image/png;base64,{encoded}',
+    }
@@ -6,6 +6,7 @@ app_name = 'post'
 urlpatterns = [
     path('', views.index, name='index'),
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
+    path('search/', views.search_posts, name='search'),
     path('profile/<str:username>/', views.profile, name='profile'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path('create/', views.post_create, name='post_create'),
@@ -16,6 +17,7 @@ urlpatterns = [
     path(
         'follow/', views.follow_index, name='follow_index'
     ),
+    path('follow/events/', views.follow_events, name='follow_events'),
     path(
         'profile/<str:username>/follow/',
         views.profile_follow,
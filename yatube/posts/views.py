@@ -1,20 +1,32 @@
+from urllib.parse import urlencode
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.db.models import Max
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
-from django.views.decorators.cache import cache_page
 
-from core.common.utils import paginate
+from core.common import invalidation
+from core.common.paginator import CachedCountPaginator
+from core.common.utils import POSTS_PER_PAGE, paginate
 
+from . import (conditional, events, feeds, page_cache, search, stats,
+               thumbnails, timeline, uploads)
 from .forms import CommentForm, PostForm
 from .models import Comment, Group, Post, User, Follow
 
+# Группы по slug в памяти процесса; сбрасываются сигналами групп.
+groups = invalidation.LocalCache('group')
+
 
-@cache_page(20)
+@conditional.condition(conditional.index)
+@page_cache.cache_feed(feeds.INDEX)
 def index(request):
     template = 'posts/index.html'
     text = "Последние обновления на сайте"
-    posts = Post.objects.select_related('group').all()
-    page_obj = paginate(request, posts)
+    posts = Post.objects.for_feed()
+    page_obj = paginate(request, posts, feeds.count_key(feeds.INDEX))
+    thumbnails.prefetch(page_obj)
     context = {
         'text': text,
         'posts': posts,
@@ -23,12 +35,19 @@ def index(request):
     return render(request, template, context)
 
 
+@conditional.condition(conditional.group_posts)
+@page_cache.cache_feed(feeds.group_page)
 def group_posts(request, slug):
     template = 'posts/group_list.html'
-    group = get_object_or_404(Group, slug=slug)
-    posts = Post.objects.filter(group=group)
+    group = groups.get_or_set(
+        slug, lambda: get_object_or_404(Group, slug=slug)
+    )
+    posts = Post.objects.for_feed().filter(group=group)
     description = group.description
-    page_obj = paginate(request, posts)
+    page_obj = paginate(
+        request, posts, feeds.count_key(feeds.group_scope(group.pk))
+    )
+    thumbnails.prefetch(page_obj)
     context = {
         'group': group,
         'posts': posts,
@@ -38,32 +57,53 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+def search_posts(request):
+    template = 'posts/search.html'
+    query = request.GET.get('q', '').strip()
+    results = []
+    if query:
+        results = search.search(query, settings.SEARCH_RESULTS_LIMIT)
+    paginator = CachedCountPaginator(results, POSTS_PER_PAGE)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, template, context)
+
+
+@conditional.condition(conditional.post_detail)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    username = post.author.username
-    count = Post.objects.filter(author__username=username).count()
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), pk=post_id
+    )
     form = CommentForm()
-    comments = Comment.objects.filter(post=post_id)
+    comments = Comment.objects.filter(post=post_id).select_related('author')
     context = {
         'post': post,
-        'count': count,
+        'stats': stats.stats_for(post.author),
         'form': form,
         'comments': comments,
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+@conditional.condition(conditional.profile)
+@page_cache.cache_feed(feeds.profile_page)
 def profile(request, username):
     author = get_object_or_404(User, username=username)
-    post_all = author.posts.all()
-    post_cnt = author.posts.all().count()
-    page_obj = paginate(request, post_all)
+    post_all = author.posts.for_feed()
+    page_obj = paginate(
+        request, post_all, feeds.count_key(feeds.author_scope(author.pk))
+    )
+    thumbnails.prefetch(page_obj)
     following = Follow.objects.filter(
         user__username=request.user.username, author=author
     ).exists()
     context = {
         'page_obj': page_obj,
-        'count': post_cnt,
+        'stats': stats.stats_for(author),
         'username': username,
         'author': author,
         'following': following,
@@ -72,8 +112,9 @@ def profile(request, username):
 
 
 @login_required
+@uploads.stream_images
 def post_create(request):
-    form = PostForm(request.POST or None)
+    form = PostForm(request.POST or None, files=request.FILES or None)
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
@@ -87,6 +128,7 @@ def post_create(request):
 
 
 @login_required
+@uploads.stream_images
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     if request.user.username != post.author.username:
@@ -116,18 +158,38 @@ def post_edit(request, post_id):
 
 
 @login_required
+@conditional.condition(conditional.follow_index)
 def follow_index(request):
     template = 'posts/follow.html'
-    posts = Post.objects.filter(author__following__user=request.user)
-    page_obj = paginate(request, posts)
+    page_obj = timeline.paginate_feed(request, request.user)
+    thumbnails.prefetch(page_obj)
     text = "Последние записи авторов, на которых ты подписан"
     context = {
         'page_obj': page_obj,
         'text': text,
+        # Новые посты отслеживаются только на первой странице: на
+        # следующих новыми сочлись бы посты предыдущих страниц.
+        'latest': None if page_obj.has_previous() else max(
+            (post.pk for post in page_obj), default=0
+        ),
     }
     return render(request, template, context)
 
 
+@login_required
+def follow_events(request):
+    """Поток уведомлений о постах подписок новее поста after
+    (или Last-Event-ID при переподключении)."""
+    after = (
+        request.META.get('HTTP_LAST_EVENT_ID')
+        or request.GET.get('after', '')
+    )
+    if not after.isdigit():
+        # Без отметки считаются посты, вышедшие после подключения.
+        after = Post.objects.aggregate(last=Max('pk'))['last'] or 0
+    return events.EventStream(request.user.pk, int(after))
+
+
 @login_required
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
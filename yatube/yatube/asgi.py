@@ -0,0 +1,19 @@
+"""
+ASGI config for yatube project.
+
+It exposes the ASGI callable as a module-level variable named
+``application``. Django 2.2 has no ASGI handler of its own, so the WSGI
+application runs in a thread pool behind core.common.asgi.ASGIHandler::
+
+    uvicorn yatube.asgi:application
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+from core.common.asgi import ASGIHandler
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+application = ASGIHandler(get_wsgi_application())
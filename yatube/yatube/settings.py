@@ -15,6 +15,13 @@ import os
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# Файлы, которые проект пишет во время работы: общий кеш, шина
+# инвалидации, контрольная точка сборки медиа. Тесты задают свой
+# каталог (см. settings_test), и его наследуют дочерние процессы.
+RUNTIME_DIR = os.environ.get(
+    'YATUBE_RUNTIME_DIR', os.path.join(BASE_DIR, 'var')
+)
+
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
@@ -37,9 +44,12 @@ ALLOWED_HOSTS = [
     '51.250.25.203'
 ]
 
+# Общий для всех воркеров кеш в файле SQLite (см. core.common.cache).
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.common.cache.SQLiteCache',
+        'LOCATION': os.path.join(RUNTIME_DIR, 'cache.sqlite3'),
+        'OPTIONS': {'MAX_BYTES': 64 * 1024 * 1024},
     }
 }
 # Application definition
@@ -59,6 +69,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.common.staticfiles.StaticFilesMiddleware',
+    'core.common.profiling.SQLProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -91,6 +103,22 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
+# Потоки, в которых yatube.asgi выполняет запросы; соединений может быть
+# сколько угодно больше.
+ASGI_THREADS = 16
+
+# Уведомления о новых постах подписок: как часто проверяется шина, как
+# часто тихому соединению отправляется комментарий (с) и через сколько
+# переподключается браузер без ASGI (мс).
+FOLLOW_EVENTS_POLL_INTERVAL = 0.5
+FOLLOW_EVENTS_KEEPALIVE = 25
+FOLLOW_EVENTS_RETRY = 15000
+
+# Профилирование SQL: доля замеряемых запросов (0 — выключено) и с
+# какого числа повторов одного запроса он считается N+1.
+SQL_PROFILE_SAMPLE_RATE = 0.01
+SQL_PROFILE_REPEAT_THRESHOLD = 5
+
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
@@ -141,6 +169,20 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+
+# Имена с хешем содержимого, сжатые копии и вычищенный Bootstrap;
+# раздаёт собранное core.common.staticfiles.StaticFilesMiddleware.
+STATICFILES_STORAGE = (
+    'core.common.staticfiles.CompressedManifestStaticFilesStorage'
+)
+
+# CSS, из которого при сборке удаляются правила для классов, не
+# встречающихся в шаблонах, и классы, которые нужно оставить всегда.
+STATIC_PURGE_FILES = ['css/bootstrap.min.css']
+STATIC_PURGE_TEMPLATES = [os.path.join(BASE_DIR, 'templates')]
+STATIC_PURGE_SAFELIST = ['active', 'show', 'collapsing', 'is-invalid']
+
 LOGIN_URL = 'users:login'
 
 LOGIN_REDIRECT_URL = 'post:index'
@@ -156,3 +198,54 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Постраничная навигация лент: 'keyset' — по курсору без COUNT(*),
+# 'elided' — номера страниц с закешированным числом записей.
+POSTS_PAGINATION = 'keyset'
+
+POSTS_COUNT_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Сколько последних постов автора попадает в ленту при подписке.
+TIMELINE_BACKFILL_LIMIT = 1000
+
+# С какого числа подписчиков посты автора не раскладываются по лентам,
+# а подмешиваются в ленту подписок при чтении.
+FEED_CELEBRITY_THRESHOLD = 10000
+
+# Сколько самых релевантных постов показывает поиск.
+SEARCH_RESULTS_LIMIT = 200
+
+# Страницы лент живут в кеше до записи в ленту; таймаут лишь
+# освобождает место от страниц, которые давно не открывали.
+FEED_PAGE_CACHE_TIMEOUT = 60 * 60
+# Сколько ещё после устаревания страницу можно отдавать, пока другой
+# запрос её пересобирает, и сколько живёт блокировка пересборки.
+FEED_PAGE_STALE_TIMEOUT = 60
+FEED_PAGE_LOCK_TIMEOUT = 10
+
+# Файл с поколениями для сброса кешей в памяти воркеров
+# (см. core.common.invalidation).
+INVALIDATION_BUS_PATH = os.path.join(RUNTIME_DIR, 'invalidation.bus')
+
+# Процессы, строящие миниатюры картинок постов; 0 — строить сразу
+# после коммита в том же процессе. Миниатюры только в JPEG (см.
+# posts.thumbnails.FORMAT): WebP в Pillow из requirements.txt нет.
+THUMBNAIL_WORKERS = 2
+
+# Картинки постов: предельный размер файла, число пикселей (против
+# «бомб» распаковки), допустимые форматы и сторона, до которой картинка
+# уменьшается при загрузке.
+POST_IMAGE_MAX_BYTES = 20 * 1024 ** 2
+POST_IMAGE_MAX_PIXELS = 40 * 10 ** 6
+POST_IMAGE_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+POST_IMAGE_MAX_SIDE = 2560
+
+# Где manage.py collect_media запоминает, докуда дошёл прерванный прогон.
+MEDIA_GC_CHECKPOINT = os.path.join(RUNTIME_DIR, 'media_gc.json')
+
+# Сколько места могут занимать миниатюры картинок постов; давно не
+# показанные сверх этого удаляются и строятся заново при показе.
+# 0 — без ограничения.
+THUMBNAIL_CACHE_MAX_BYTES = 1024 ** 3
+# Как часто процесс записывает время показа одной картинки.
+THUMBNAIL_ACCESS_RESOLUTION = 10 * 60
@@ -0,0 +1,30 @@
+"""Настройки тестов.
+
+Всё, что проект пишет во время работы, — во временном каталоге вне
+дерева исходников. Каталог создаёт первый процесс прогона и передаёт
+через окружение: дочерние процессы с этими настройками пишут туда же.
+"""
+import atexit
+import os
+import shutil
+import tempfile
+
+if 'YATUBE_TEST_RUNTIME_DIR' not in os.environ:
+    os.environ['YATUBE_TEST_RUNTIME_DIR'] = tempfile.mkdtemp(
+        prefix='yatube-test-'
+    )
+    atexit.register(
+        shutil.rmtree, os.environ['YATUBE_TEST_RUNTIME_DIR'], True
+    )
+os.environ['YATUBE_RUNTIME_DIR'] = os.environ['YATUBE_TEST_RUNTIME_DIR']
+
+from .settings import *  # noqa: E402,F401,F403
+from .settings import RUNTIME_DIR  # noqa: E402
+
+MEDIA_ROOT = os.path.join(RUNTIME_DIR, 'media')
+
+STATIC_ROOT = os.path.join(RUNTIME_DIR, 'staticfiles')
+
+# Процессы пула не видят тестовую базу и переопределённые в тестах
+# настройки: миниатюры строятся сразу после коммита.
+THUMBNAIL_WORKERS = 0
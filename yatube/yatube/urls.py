@@ -3,9 +3,12 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from core import views as core_views
+
 urlpatterns = [
     path('', include('posts.urls', namespace='post')),
     path('group/', include('posts.urls', namespace='post')),
+    path('admin/sql-profile/', core_views.sql_profile, name='sql_profile'),
     path('admin/', admin.site.urls),
     path('auth/', include('users.urls', namespace='users')),
     path('auth/', include('django.contrib.auth.urls')),